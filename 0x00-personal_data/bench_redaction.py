@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+"""Benchmark of the filtered_logger redaction code
+
+Generate synthetic PII log corpora and measure throughput, per record
+latency percentiles and allocations of filter_datum, RedactingFormatter
+and the bulk chunk redaction. Every measurement follows an untimed
+warm-up pass and is repeated, the median run being reported. Results
+are written as JSON and can be compared with an earlier run:
+
+    ./bench_redaction.py -o new.json --compare old.json
+"""
+import argparse
+import io
+import json
+import logging
+import random
+import statistics
+import string
+import time
+import tracemalloc
+from typing import Callable, Dict, List
+
+from filtered_logger import (
+    PII_FIELDS, RedactingFormatter, filter_datum, redact_chunks)
+
+FILLER_FIELDS = ["user_agent", "path", "status", "last_login", "ref"]
+SEPARATOR = RedactingFormatter.SEPARATOR
+REPEAT = 5
+
+
+def make_corpus(
+        records: int,
+        field_count: int,
+        value_length: int,
+        pii_density: float,
+        seed: int = 0) -> List[str]:
+    """Build records key=value; lines
+
+    Every line holds field_count fields whose values are value_length
+    characters long; pii_density is the share of those fields that are
+    PII fields.
+    """
+    rnd = random.Random(seed)
+    alphabet = string.ascii_letters + string.digits + "@.-"
+    corpus = []
+    for _ in range(records):
+        parts = []
+        for i in range(field_count):
+            if rnd.random() < pii_density:
+                key = PII_FIELDS[i % len(PII_FIELDS)]
+            else:
+                key = "{}{}".format(FILLER_FIELDS[i % len(FILLER_FIELDS)], i)
+            value = "".join(rnd.choice(alphabet) for _ in range(value_length))
+            parts.append("{}={}{}".format(key, value, SEPARATOR))
+        corpus.append("".join(parts))
+    return corpus
+
+
+def percentile(samples: List[float], pct: float) -> float:
+    """Nearest rank percentile of sorted samples"""
+    if not samples:
+        return 0.0
+    rank = min(len(samples) - 1, int(round(pct / 100 * (len(samples) - 1))))
+    return samples[rank]
+
+
+def median_run(runs: List[Dict]) -> Dict:
+    """Median of every metric over repeated runs"""
+    return {key: statistics.median(run[key] for run in runs)
+            for key in runs[0]}
+
+
+def measure_records(
+        func: Callable[[str], str],
+        corpus: List[str],
+        repeat: int = REPEAT) -> Dict:
+    """Time func on each record of the corpus, repeat times"""
+    timer = time.perf_counter_ns
+    for line in corpus:
+        func(line)
+    runs = []
+    for _ in range(repeat):
+        latencies = []
+        start = timer()
+        for line in corpus:
+            t0 = timer()
+            func(line)
+            latencies.append(timer() - t0)
+        total = (timer() - start) / 1e9
+        latencies.sort()
+        runs.append({
+            "records_per_sec": len(corpus) / total if total else 0.0,
+            "p50_us": percentile(latencies, 50) / 1e3,
+            "p99_us": percentile(latencies, 99) / 1e3,
+            "p999_us": percentile(latencies, 99.9) / 1e3,
+        })
+    return median_run(runs)
+
+
+def measure_allocations(func: Callable[[], object]) -> Dict:
+    """Retained and peak traced allocations of one call of func"""
+    tracemalloc.start()
+    func()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {"alloc_current_kb": current / 1024, "alloc_peak_kb": peak / 1024}
+
+
+def bench_single(corpus: List[str], repeat: int = REPEAT) -> Dict:
+    """filter_datum called once per record"""
+    def run(line):
+        return filter_datum(PII_FIELDS, "***", line, SEPARATOR)
+    result = measure_records(run, corpus, repeat)
+    result.update(measure_allocations(lambda: [run(ln) for ln in corpus]))
+    return result
+
+
+def bench_formatter(corpus: List[str], repeat: int = REPEAT) -> Dict:
+    """RedactingFormatter.format called once per record"""
+    formatter = RedactingFormatter(fields=PII_FIELDS)
+
+    def run(line):
+        record = logging.LogRecord(
+            "user_data", logging.INFO, __file__, 0, line, None, None)
+        return formatter.format(record)
+    result = measure_records(run, corpus, repeat)
+    result.update(measure_allocations(lambda: [run(ln) for ln in corpus]))
+    return result
+
+
+def bench_bulk(
+        corpus: List[str], chunk_size: int, repeat: int = REPEAT) -> Dict:
+    """redact_chunks over the whole corpus as one stream"""
+    text = "\n".join(corpus) + "\n"
+
+    def run():
+        stream = io.StringIO(text)
+        for _ in redact_chunks(stream, PII_FIELDS, chunk_size=chunk_size):
+            pass
+    run()
+    runs = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run()
+        total = time.perf_counter() - start
+        runs.append({
+            "records_per_sec": len(corpus) / total if total else 0.0,
+            "mb_per_sec": len(text) / total / 1e6 if total else 0.0,
+        })
+    result = median_run(runs)
+    result.update(measure_allocations(run))
+    return result
+
+
+def run_suite(args: argparse.Namespace) -> List[Dict]:
+    """Run every mode on every corpus shape"""
+    results = []
+    for field_count in args.fields:
+        for value_length in args.lengths:
+            for density in args.densities:
+                corpus = make_corpus(
+                    args.records, field_count, value_length, density)
+                shape = {
+                    "records": args.records,
+                    "field_count": field_count,
+                    "value_length": value_length,
+                    "pii_density": density,
+                }
+                modes = {
+                    "single": lambda: bench_single(corpus, args.repeat),
+                    "formatter": lambda: bench_formatter(
+                        corpus, args.repeat),
+                    "bulk": lambda: bench_bulk(
+                        corpus, args.chunk_size, args.repeat),
+                }
+                for mode, bench in modes.items():
+                    result = dict(shape, mode=mode)
+                    result.update(bench())
+                    results.append(result)
+    return results
+
+
+def result_key(result: Dict) -> tuple:
+    """Identify a result across runs"""
+    return (result["mode"], result["field_count"], result["value_length"],
+            result["pii_density"])
+
+
+def compare(results: List[Dict], baseline: List[Dict]):
+    """Print the throughput change of every result against baseline"""
+    previous = {result_key(res): res for res in baseline}
+    for res in results:
+        old = previous.get(result_key(res))
+        if not old or not old["records_per_sec"]:
+            continue
+        change = res["records_per_sec"] / old["records_per_sec"] - 1
+        print("{:<9} fields={:<3} len={:<4} pii={:<4} {:>+7.1%}".format(
+            res["mode"], res["field_count"], res["value_length"],
+            res["pii_density"], change))
+
+
+def main():
+    """Parse arguments, run the suite and write the results"""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--records", type=int, default=10000)
+    parser.add_argument("--fields", type=int, nargs="+", default=[5, 20])
+    parser.add_argument("--lengths", type=int, nargs="+", default=[8, 64])
+    parser.add_argument(
+        "--densities", type=float, nargs="+", default=[0.2, 0.8])
+    parser.add_argument("--chunk-size", type=int, default=1 << 20)
+    parser.add_argument("--repeat", type=int, default=REPEAT)
+    parser.add_argument("-o", "--output", help="write JSON results here")
+    parser.add_argument("--compare", help="JSON results of an earlier run")
+    args = parser.parse_args()
+
+    results = run_suite(args)
+    payload = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(payload)
+    else:
+        print(payload)
+    if args.compare:
+        with open(args.compare, "r") as f:
+            compare(results, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
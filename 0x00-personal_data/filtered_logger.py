@@ -1,13 +1,60 @@
 #!/usr/bin/env python3
 """This module define a filterred logger function
 """
+import atexit
 import logging
+import logging.handlers
+import os
+import queue
 import re
-from typing import List
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from typing import IO, Dict, Iterable, Iterator, List, Optional, Sequence
 
-pat = "{}=(?P<{}>.*?){}"
-fd = re.findall
 PII_FIELDS = ["name", "email", "phone", "password", "ip"]
+ENGINE_CACHE_SIZE = 128
+CHUNK_SIZE = 1 << 20
+QUEUE_SIZE = 10000
+BATCH_SIZE = 256
+OVERFLOW_POLICIES = ("block", "drop_oldest", "drop_new")
+
+
+class RedactionEngine:
+    """Redact the values of a fixed set of fields in a single pass
+    """
+
+    def __init__(self, fields: Sequence[str], separator: str):
+        self.fields = tuple(fields)
+        self.separator = separator
+        # A field is not preceded by a key character, so "name" does not
+        # match inside "username" but still matches after "login: "
+        self.pattern = re.compile(r"(?<![\w.-])({})=.*?(?={})".format(
+            "|".join(re.escape(fi) for fi in self.fields),
+            re.escape(separator)))
+
+    def redact(self, redaction: str, message: str) -> str:
+        """Replace every field value found in message with redaction
+        """
+        if not self.fields:
+            return message
+        repl = r"\1=" + redaction.replace("\\", r"\\")
+        return self.pattern.sub(repl, message)
+
+
+@lru_cache(maxsize=ENGINE_CACHE_SIZE)
+def _engine_for(fields: tuple, separator: str) -> RedactionEngine:
+    """Build the engine of a (fields, separator) pair once
+    """
+    return RedactionEngine(fields, separator)
+
+
+def get_engine(fields: Sequence[str], separator: str) -> RedactionEngine:
+    """Get the cached redaction engine for fields and separator
+    """
+    return _engine_for(tuple(fields), separator)
 
 
 def filter_datum(
@@ -16,9 +63,7 @@ def filter_datum(
         message: str,
         separator: str) -> str:
     """Perform filtering and replacement"""
-    n = fd("".join([pat.format(fi, fi, separator) for fi in fields]), message)
-    va = "" if not n else "|".join(["=" + i for i in n[0]])
-    return message if not fields else re.sub(va, "=" + redaction, message)
+    return get_engine(fields, separator).redact(redaction, message)
 
 
 class RedactingFormatter(logging.Formatter):
@@ -32,22 +77,260 @@ class RedactingFormatter(logging.Formatter):
     def __init__(self, fields: List[str]):
         super(RedactingFormatter, self).__init__(self.FORMAT)
         self.fields = fields
+        self.engine = get_engine(fields, self.SEPARATOR)
 
     def format(self, record: logging.LogRecord) -> str:
         """format for the log message"""
-        record.msg = filter_datum(
-                self.fields, self.REDACTION, record.msg, self.SEPARATOR)
+        record.msg = self.engine.redact(self.REDACTION, record.msg)
         return super().format(record)
 
 
-def get_logger() -> logging.Logger:
+def redact_lines(
+        lines: Iterable[str],
+        fields: Sequence[str],
+        redaction: str = RedactingFormatter.REDACTION,
+        separator: str = RedactingFormatter.SEPARATOR) -> Iterator[str]:
+    """Lazily yield every line of lines with its fields redacted
+    """
+    engine = get_engine(fields, separator)
+    for line in lines:
+        yield engine.redact(redaction, line)
+
+
+def iter_chunks(
+        stream: IO[str],
+        chunk_size: int = CHUNK_SIZE) -> Iterator[str]:
+    """Read stream by chunk_size characters and yield line aligned chunks
+    """
+    rest = ""
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            break
+        chunk = rest + chunk
+        end = chunk.rfind("\n") + 1
+        if not end:
+            rest = chunk
+            continue
+        rest = chunk[end:]
+        yield chunk[:end]
+    if rest:
+        yield rest
+
+
+def redact_chunks(
+        stream: IO[str],
+        fields: Sequence[str],
+        redaction: str = RedactingFormatter.REDACTION,
+        separator: str = RedactingFormatter.SEPARATOR,
+        chunk_size: int = CHUNK_SIZE) -> Iterator[str]:
+    """Lazily yield redacted line aligned chunks read from stream
+
+    A value never spans a newline, so a whole chunk of lines is redacted
+    with a single call instead of one call per line.
+    """
+    engine = get_engine(fields, separator)
+    for chunk in iter_chunks(stream, chunk_size):
+        yield engine.redact(redaction, chunk)
+
+
+def _count_lines(chunk: str) -> int:
+    """Number of lines in chunk, counting a last line without newline
+    """
+    return chunk.count("\n") + (not chunk.endswith("\n"))
+
+
+def redact_file(
+        source: str,
+        sink: str,
+        fields: Sequence[str] = PII_FIELDS,
+        redaction: str = RedactingFormatter.REDACTION,
+        separator: str = RedactingFormatter.SEPARATOR,
+        chunk_size: int = CHUNK_SIZE) -> int:
+    """Redact the log file at source into sink with bounded memory
+
+    Returns the number of lines written.
+    """
+    lines = 0
+    with open(source, "r") as src, open(sink, "w") as dst:
+        for chunk in redact_chunks(
+                src, fields, redaction, separator, chunk_size):
+            dst.write(chunk)
+            lines += _count_lines(chunk)
+    return lines
+
+
+def _redact_chunk(
+        fields: tuple, redaction: str, separator: str, chunk: str) -> str:
+    """Redact one chunk inside a worker process
+    """
+    return get_engine(fields, separator).redact(redaction, chunk)
+
+
+def parallel_redact_file(
+        source: str,
+        sink: str,
+        fields: Sequence[str] = PII_FIELDS,
+        redaction: str = RedactingFormatter.REDACTION,
+        separator: str = RedactingFormatter.SEPARATOR,
+        workers: Optional[int] = None,
+        chunk_size: int = CHUNK_SIZE) -> Dict[str, float]:
+    """Redact the log file at source into sink on a pool of processes
+
+    The file is split into line aligned chunks which are redacted on
+    workers processes (all cores by default) and written back in their
+    original order. At most two chunks per worker are in flight.
+
+    Returns the number of lines, the elapsed seconds and the lines/s.
+    """
+    workers = workers or os.cpu_count() or 1
+    fields = tuple(fields)
+    lines = 0
+    start = time.perf_counter()
+    with open(source, "r") as src, open(sink, "w") as dst, \
+            ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        for chunk in iter_chunks(src, chunk_size):
+            pending.append(pool.submit(
+                _redact_chunk, fields, redaction, separator, chunk))
+            if len(pending) >= 2 * workers:
+                done = pending.popleft().result()
+                dst.write(done)
+                lines += _count_lines(done)
+        while pending:
+            done = pending.popleft().result()
+            dst.write(done)
+            lines += _count_lines(done)
+    elapsed = time.perf_counter() - start
+    return {
+        "lines": lines,
+        "seconds": elapsed,
+        "lines_per_sec": lines / elapsed if elapsed else 0.0}
+
+
+class BoundedQueueHandler(logging.handlers.QueueHandler):
+    """Queue handler that hands raw records to a bounded queue
+
+    Redaction and formatting are left to the listener thread. When the
+    queue is full, overflow decides whether the caller blocks, the oldest
+    queued record is dropped or the new record is dropped.
+    """
+
+    def __init__(self, log_queue: queue.Queue, overflow: str = "block"):
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError("overflow must be one of {}".format(
+                OVERFLOW_POLICIES))
+        super().__init__(log_queue)
+        self.overflow = overflow
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        """Keep the record untouched for the listener"""
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        """Put record on the queue following the overflow policy"""
+        if self.overflow == "block":
+            self.queue.put(record)
+            return
+        while True:
+            try:
+                self.queue.put_nowait(record)
+                return
+            except queue.Full:
+                self.dropped += 1
+                if self.overflow == "drop_new":
+                    return
+            try:
+                self.queue.get_nowait()
+            except queue.Empty:
+                pass
+
+
+class BatchQueueListener:
+    """Background thread formatting and writing queued records in batches
+    """
+    _sentinel = None
+
+    def __init__(
+            self,
+            log_queue: queue.Queue,
+            handler: logging.StreamHandler,
+            batch_size: int = BATCH_SIZE):
+        self.queue = log_queue
+        self.handler = handler
+        self.batch_size = batch_size
+        self._thread = None
+
+    def start(self):
+        """Start the listener thread"""
+        self._thread = threading.Thread(target=self._monitor, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Flush every queued record and stop the listener thread"""
+        if self._thread is None:
+            return
+        self.queue.put(self._sentinel)
+        self._thread.join()
+        self._thread = None
+
+    def _write(self, batch: List[logging.LogRecord]):
+        """Format a batch of records and write it with one call"""
+        handler = self.handler
+        lines = []
+        for record in batch:
+            if record.levelno < handler.level:
+                continue
+            try:
+                lines.append(handler.format(record) + handler.terminator)
+            except Exception:
+                handler.handleError(record)
+        if not lines:
+            return
+        with handler.lock:
+            handler.stream.write("".join(lines))
+            handler.flush()
+
+    def _monitor(self):
+        """Drain up to batch_size records at a time until the sentinel"""
+        while True:
+            batch = [self.queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            stop = self._sentinel in batch
+            if stop:
+                batch = batch[:batch.index(self._sentinel)]
+            self._write(batch)
+            if stop:
+                return
+
+
+def get_logger(
+        asynchronous: bool = False,
+        queue_size: int = QUEUE_SIZE,
+        overflow: str = "block",
+        batch_size: int = BATCH_SIZE) -> logging.Logger:
     """Get a new logger
+
+    With asynchronous set, records are put on a bounded queue of
+    queue_size records and redacted, formatted and written in batches by
+    a background listener, which is flushed at interpreter exit.
     """
-    this_logger = logging.Logger(
-            name="user_data",
-            level=logging.INFO,
-            propagate=False)
+    this_logger = logging.Logger(name="user_data", level=logging.INFO)
+    this_logger.propagate = False
     stream = logging.StreamHandler()
     stream.setFormatter(RedactingFormatter(fields=PII_FIELDS))
-    this_logger.setHandler(logging.StreamHandler(stream))
+    if not asynchronous:
+        this_logger.addHandler(stream)
+        return this_logger
+    log_queue = queue.Queue(maxsize=queue_size)
+    handler = BoundedQueueHandler(log_queue, overflow)
+    handler.listener = BatchQueueListener(log_queue, stream, batch_size)
+    handler.listener.start()
+    atexit.register(handler.listener.stop)
+    this_logger.addHandler(handler)
     return this_logger
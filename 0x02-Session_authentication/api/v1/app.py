@@ -22,6 +22,9 @@ elif auth == 'session_auth':
 elif auth:
     from api.v1.auth.auth import Auth
     auth = Auth()
+if getenv("PERF_STATS"):
+    from api.v1 import perf
+    perf.init_app(app, auth, float(getenv("PERF_SAMPLE_RATE", "1")))
 
 paths = [
         '/api/v1/status/', '/api/v1/unauthorized/', '/api/v1/forbidden/',
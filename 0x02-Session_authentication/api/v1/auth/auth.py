@@ -2,34 +2,113 @@
 """This Module define the authentication
 """
 from flask import request
+from functools import lru_cache
 from typing import TypeVar, List
 import re
 import os
 
 
+class PathMatcher:
+    """Match paths against a list of excluded path patterns
+
+    Patterns keep the re.match semantics of require_auth: literal ones
+    are prefixes looked up in a trie, the others (like /api/v1/stat*) are
+    combined into one compiled regex. Recent results are memoized.
+    """
+    _END = ""
+
+    def __init__(self, excluded_paths: List[str], cache_size: int = 1024):
+        self.trie = {}
+        patterns = []
+        for ex_path in excluded_paths:
+            if re.escape(ex_path) == ex_path:
+                node = self.trie
+                for char in ex_path:
+                    node = node.setdefault(char, {})
+                node[self._END] = True
+            else:
+                patterns.append("(?:{})".format(ex_path))
+        self.regex = re.compile("|".join(patterns)) if patterns else None
+        self.matches = lru_cache(maxsize=cache_size)(self._matches)
+
+    def _matches(self, path: str) -> bool:
+        """Check if path starts with an excluded path
+        """
+        node = self.trie
+        if self._END in node:
+            return True
+        for char in path:
+            node = node.get(char)
+            if node is None:
+                break
+            if self._END in node:
+                return True
+        return self.regex is not None and self.regex.match(path) is not None
+
+
+_UNSET = object()
+
+
+class AuthContext:
+    """Identity of one request, each part resolved at most once
+    """
+    def __init__(self):
+        self.authorization_header = _UNSET
+        self.session_cookie = _UNSET
+        self.session_user_id = _UNSET
+        self.user = _UNSET
+
+
 class Auth:
     """The Auth class to implement authentications
     """
+    def auth_context(self, request=None) -> AuthContext:
+        """Get the auth context of request, created on first use
+        """
+        if request is None:
+            return AuthContext()
+        ctx = getattr(request, "auth_context", None)
+        if ctx is None:
+            ctx = AuthContext()
+            request.auth_context = ctx
+        return ctx
+
+    def _memoized_user(self, request, resolve) -> TypeVar('User'):
+        """Resolve the user of request once with resolve(request)
+        """
+        ctx = self.auth_context(request)
+        if ctx.user is _UNSET:
+            ctx.user = resolve(request)
+        return ctx.user
+
+    def _path_matcher(self, excluded_paths: List[str]) -> PathMatcher:
+        """Get the compiled matcher of excluded_paths
+        """
+        key = tuple(excluded_paths)
+        matcher = getattr(self, "_matcher", None)
+        if matcher is None or matcher[0] != key:
+            matcher = (key, PathMatcher(excluded_paths))
+            self._matcher = matcher
+        return matcher[1]
+
     def require_auth(self, path: str, excluded_paths: List[str]) -> bool:
         """Check if authentication is required
         """
         if path is None or not excluded_paths:
             return True
         path = path if path.endswith("/") else path + "/"
-        for ex_path in excluded_paths:
-            if re.match(ex_path, path):
-                return False
-        return True
+        return not self._path_matcher(excluded_paths).matches(path)
 
     def authorization_header(self, request=None) -> str:
         """Used for Authorization Header
         """
         if request is None:
             return None
-        authorization = request.headers.get("Authorization")
-        if not authorization:
-            return None
-        return authorization
+        ctx = self.auth_context(request)
+        if ctx.authorization_header is _UNSET:
+            authorization = request.headers.get("Authorization")
+            ctx.authorization_header = authorization or None
+        return ctx.authorization_header
 
     def current_user(self, request=None) -> TypeVar('User'):
         """Get the current user
@@ -41,5 +120,8 @@ class Auth:
         """
         if not request:
             return None
-        session_id = os.getenv("SESSION_NAME")
-        return request.cookies.get(session_id)
+        ctx = self.auth_context(request)
+        if ctx.session_cookie is _UNSET:
+            session_id = os.getenv("SESSION_NAME")
+            ctx.session_cookie = request.cookies.get(session_id)
+        return ctx.session_cookie
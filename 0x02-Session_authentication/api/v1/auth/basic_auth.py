@@ -3,14 +3,85 @@
 """
 from .auth import Auth
 import base64
+from collections import OrderedDict
+import hashlib
+import hmac
+import os
+import threading
+import time
 from models.user import User
 from typing import List, TypeVar
 from flask import request
 
 
+class CredentialCache:
+    """Bounded TTL cache of verified Authorization headers
+
+    Headers are keyed by their HMAC under a per-process secret, so raw
+    credentials are never kept. An entry remembers the user id, email and
+    password hash it was verified against: it is ignored once the user is
+    removed or their email or password changes.
+    """
+    def __init__(self, max_size: int = 10000, ttl: float = 300):
+        """Initialize an empty cache of max_size entries living ttl seconds
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self._secret = os.urandom(32)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _key(self, authorization_header: str) -> bytes:
+        """Keyed hash of an Authorization header
+        """
+        return hmac.new(self._secret, authorization_header.encode(),
+                        hashlib.sha256).digest()
+
+    def get(self, authorization_header: str) -> TypeVar('User'):
+        """Get the user verified for an Authorization header
+        """
+        key = self._key(authorization_header)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            user_id, email, password, expires = entry
+            if expires < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+        user = User.get(user_id)
+        if user is None or user.email != email \
+                or user.password != password:
+            with self._lock:
+                self._entries.pop(key, None)
+            return None
+        return user
+
+    def put(self, authorization_header: str, user: TypeVar('User')):
+        """Remember the user verified for an Authorization header
+        """
+        key = self._key(authorization_header)
+        entry = (user.id, user.email, user.password,
+                 time.monotonic() + self.ttl)
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+
 class BasicAuth(Auth):
     """The Basic Authentication class
     """
+    def __init__(self):
+        """Initialize the credential cache, sized by BASIC_AUTH_CACHE_SIZE
+        and BASIC_AUTH_CACHE_TTL
+        """
+        self.credential_cache = CredentialCache(
+            int(os.getenv("BASIC_AUTH_CACHE_SIZE", "10000")),
+            float(os.getenv("BASIC_AUTH_CACHE_TTL", "300")))
+
     def extract_base64_authorization_header(
             self, authorization_header: str) -> str:
         """Extract base64 auth from the auth header
@@ -69,9 +140,17 @@ class BasicAuth(Auth):
     def current_user(self, request=None) -> TypeVar('User'):
         """Get the current loggedin user
         """
+        return self._memoized_user(request, self._resolve_user)
+
+    def _resolve_user(self, request=None) -> TypeVar('User'):
+        """Resolve the user of the Authorization header of request
+        """
         auth_header = self.authorization_header(request)
         if not auth_header:
             return None
+        user = self.credential_cache.get(auth_header)
+        if user:
+            return user
         base64_extract = self.extract_base64_authorization_header(
                 auth_header)
         if not base64_extract:
@@ -84,4 +163,6 @@ class BasicAuth(Auth):
         if not any(credentials):
             return None
         user = self.user_object_from_credentials(*credentials)
+        if user:
+            self.credential_cache.put(auth_header, user)
         return user
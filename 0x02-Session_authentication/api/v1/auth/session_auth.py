@@ -1,7 +1,8 @@
 #!/usr/bin/env python3
 """This module define the Session Auth class
 """
-from .auth import Auth
+from .auth import _UNSET, Auth
+from .session_store import get_session_store
 import uuid
 from models.user import User
 from typing import TypeVar
@@ -12,13 +13,16 @@ class SessionAuth(Auth):
     """
     user_id_by_session_id = {}
 
+    def __init__(self):
+        self.store = get_session_store(self.user_id_by_session_id)
+
     def create_session(self, user_id: str = None) -> str:
         """Create a session
         """
         if not user_id or not isinstance(user_id, str):
             return None
         session_id = str(uuid.uuid4())
-        self.user_id_by_session_id[session_id] = user_id
+        self.store.set(session_id, user_id)
         return session_id
 
     def user_id_for_session_id(self, session_id: str = None) -> str:
@@ -26,22 +30,37 @@ class SessionAuth(Auth):
         """
         if not session_id or not isinstance(session_id, str):
             return None
-        return self.user_id_by_session_id.get(session_id)
+        return self.store.get(session_id)
 
     def current_user(self, request=None) -> TypeVar(User):
         """Get the current user from session_id
         """
-        session_cookie = self.session_cookie(request)
-        user_id = self.user_id_for_session_id(session_cookie)
-        return User.get(user_id)
+        return self._memoized_user(request, self._resolve_user)
+
+    def session_user_id(self, request=None) -> str:
+        """Get the user_id of the session cookie of request, looked up in
+        the store at most once per request
+        """
+        if request is None:
+            return None
+        ctx = self.auth_context(request)
+        if ctx.session_user_id is _UNSET:
+            ctx.session_user_id = self.user_id_for_session_id(
+                self.session_cookie(request))
+        return ctx.session_user_id
+
+    def _resolve_user(self, request=None) -> TypeVar(User):
+        """Resolve the user of the session cookie of request
+        """
+        return User.get(self.session_user_id(request))
 
     def destroy_session(self, request=None) -> bool:
         """Delete session in a given request
         """
-        if not request or not self.session_cookie(request):
-            return False
-        session_id = self.session_cookie(request)
-        if not self.user_id_by_session_id.get(session_id):
+        if not request or self.session_user_id(request) is None:
             return False
-        del self.user_id_by_session_id[session_id]
-        return True
+        deleted = self.store.delete(self.session_cookie(request))
+        ctx = self.auth_context(request)
+        ctx.session_user_id = None
+        ctx.user = None
+        return deleted
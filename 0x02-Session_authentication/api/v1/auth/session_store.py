@@ -0,0 +1,274 @@
+#!/usr/bin/env python3
+"""This module define the session stores used by SessionAuth
+"""
+from abc import ABC, abstractmethod
+import heapq
+import os
+import sqlite3
+import threading
+import time
+
+
+EVICT_BATCH = 64
+SHARDS = 16
+
+
+class SessionStore(ABC):
+    """Interface of a session_id -> user_id store
+
+    A session expires duration seconds after its creation, or idle
+    seconds after its last lookup; None disables either limit.
+    Expired sessions are treated as missing.
+    """
+    def __init__(self, duration: float = None, idle: float = None):
+        self.duration = duration
+        self.idle = idle
+
+    @abstractmethod
+    def set(self, session_id: str, user_id: str):
+        """Store the user_id of session_id
+        """
+
+    @abstractmethod
+    def get(self, session_id: str) -> str:
+        """Get the user_id of session_id, None if missing or expired
+        """
+
+    @abstractmethod
+    def delete(self, session_id: str) -> bool:
+        """Remove session_id, return False if it was missing
+        """
+
+
+class MemorySessionStore(SessionStore):
+    """Session store held in the memory of one process
+
+    Expiry is driven by a min-heap of (deadline, session_id). Each call
+    pops at most EVICT_BATCH due entries: a popped session whose idle
+    deadline moved on is pushed back with its new deadline, the others
+    are reclaimed. Sessions are never scanned.
+    """
+    def __init__(self, duration: float = None, idle: float = None,
+                 data: dict = None):
+        super().__init__(duration, idle)
+        self.data = {} if data is None else data
+        self.times = {}
+        self.heap = []
+
+    def _deadline(self, session_id: str) -> float:
+        """Time at which session_id expires, None if it never does
+        """
+        times = self.times.get(session_id)
+        if times is None:
+            return None
+        created, last_seen = times
+        deadlines = []
+        if self.duration is not None:
+            deadlines.append(created + self.duration)
+        if self.idle is not None:
+            deadlines.append(last_seen + self.idle)
+        return min(deadlines)
+
+    def _evict(self, now: float):
+        """Reclaim up to EVICT_BATCH expired sessions
+        """
+        heap = self.heap
+        for _ in range(EVICT_BATCH):
+            if not heap or heap[0][0] > now:
+                return
+            _, session_id = heapq.heappop(heap)
+            deadline = self._deadline(session_id)
+            if deadline is None:
+                continue
+            if deadline <= now:
+                self.delete(session_id)
+            else:
+                heapq.heappush(heap, (deadline, session_id))
+
+    def set(self, session_id: str, user_id: str):
+        """Store the user_id of session_id
+        """
+        now = time.time()
+        self._evict(now)
+        self.data[session_id] = user_id
+        if self.duration is not None or self.idle is not None:
+            self.times[session_id] = (now, now)
+            heapq.heappush(self.heap, (self._deadline(session_id),
+                                       session_id))
+
+    def get(self, session_id: str) -> str:
+        """Get the user_id of session_id, None if missing or expired
+        """
+        now = time.time()
+        self._evict(now)
+        times = self.times.get(session_id)
+        if times is not None:
+            deadline = self._deadline(session_id)
+            if deadline <= now:
+                self.delete(session_id)
+                return None
+            if self.idle is not None:
+                self.times[session_id] = (times[0], now)
+        return self.data.get(session_id)
+
+    def delete(self, session_id: str) -> bool:
+        """Remove session_id, return False if it was missing
+        """
+        self.times.pop(session_id, None)
+        return self.data.pop(session_id, None) is not None
+
+
+class ShardedSessionStore(SessionStore):
+    """Thread-safe memory session store striped over locked shards
+
+    The shard of a session is picked by the hash of its id, so threads
+    only contend when they touch sessions of the same shard. Every shard
+    is a MemorySessionStore with its own expiry heap; they all share the
+    data dict, whose single key operations are atomic.
+    """
+    def __init__(self, duration: float = None, idle: float = None,
+                 data: dict = None, shards: int = SHARDS):
+        super().__init__(duration, idle)
+        self.data = {} if data is None else data
+        self.shards = [MemorySessionStore(duration, idle, self.data)
+                       for _ in range(shards)]
+        self.locks = [threading.Lock() for _ in range(shards)]
+
+    def _shard(self, session_id: str) -> int:
+        """Index of the shard of session_id
+        """
+        return hash(session_id) % len(self.shards)
+
+    def set(self, session_id: str, user_id: str):
+        """Store the user_id of session_id
+        """
+        i = self._shard(session_id)
+        with self.locks[i]:
+            self.shards[i].set(session_id, user_id)
+
+    def get(self, session_id: str) -> str:
+        """Get the user_id of session_id, None if missing or expired
+        """
+        i = self._shard(session_id)
+        with self.locks[i]:
+            return self.shards[i].get(session_id)
+
+    def delete(self, session_id: str) -> bool:
+        """Remove session_id, return False if it was missing
+        """
+        i = self._shard(session_id)
+        with self.locks[i]:
+            return self.shards[i].delete(session_id)
+
+
+class SQLiteSessionStore(SessionStore):
+    """Session store in a SQLite file shared by local worker processes
+
+    Expired rows are reclaimed through the indexes on their deadlines
+    once every EVICT_BATCH new sessions.
+    """
+    def __init__(self, duration: float = None, idle: float = None,
+                 path: str = ".db_sessions.sqlite"):
+        super().__init__(duration, idle)
+        self.path = path
+        self._local = threading.local()
+        self._created = 0
+        with self._connection() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS sessions ("
+                "session_id TEXT PRIMARY KEY, "
+                "user_id TEXT NOT NULL, "
+                "expires REAL, "
+                "idle_expires REAL)")
+            conn.execute("CREATE INDEX IF NOT EXISTS sessions_expires "
+                         "ON sessions (expires)")
+            conn.execute("CREATE INDEX IF NOT EXISTS sessions_idle_expires "
+                         "ON sessions (idle_expires)")
+
+    def _connection(self) -> sqlite3.Connection:
+        """Connection of the current thread
+        """
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _evict(self, conn: sqlite3.Connection, now: float):
+        """Delete every expired session
+        """
+        conn.execute("DELETE FROM sessions WHERE expires <= ?", (now,))
+        conn.execute("DELETE FROM sessions WHERE idle_expires <= ?", (now,))
+
+    def set(self, session_id: str, user_id: str):
+        """Store the user_id of session_id
+        """
+        now = time.time()
+        expires = None if self.duration is None else now + self.duration
+        idle_expires = None if self.idle is None else now + self.idle
+        self._created += 1
+        with self._connection() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO sessions VALUES (?, ?, ?, ?)",
+                (session_id, user_id, expires, idle_expires))
+            if self._created % EVICT_BATCH == 0:
+                self._evict(conn, now)
+
+    def get(self, session_id: str) -> str:
+        """Get the user_id of session_id, None if missing or expired
+        """
+        now = time.time()
+        conn = self._connection()
+        row = conn.execute(
+            "SELECT user_id, expires, idle_expires FROM sessions "
+            "WHERE session_id = ?", (session_id,)).fetchone()
+        if row is None:
+            return None
+        user_id, expires, idle_expires = row
+        if any(t is not None and t <= now for t in (expires, idle_expires)):
+            self.delete(session_id)
+            return None
+        if self.idle is not None:
+            with conn:
+                conn.execute(
+                    "UPDATE sessions SET idle_expires = ? "
+                    "WHERE session_id = ?", (now + self.idle, session_id))
+        return user_id
+
+    def delete(self, session_id: str) -> bool:
+        """Remove session_id, return False if it was missing
+        """
+        with self._connection() as conn:
+            cursor = conn.execute(
+                "DELETE FROM sessions WHERE session_id = ?", (session_id,))
+        return cursor.rowcount > 0
+
+
+def _seconds(name: str) -> float:
+    """Positive number of seconds in env var name, None otherwise
+    """
+    try:
+        seconds = float(os.getenv(name, ""))
+    except ValueError:
+        return None
+    return seconds if seconds > 0 else None
+
+
+def get_session_store(data: dict = None) -> SessionStore:
+    """Build the session store selected by SESSION_STORE
+
+    SESSION_STORE is "memory" (default, using data and split over
+    SESSION_SHARDS locked shards, at least one) or "sqlite", stored in
+    SESSION_STORE_PATH. SESSION_DURATION and SESSION_IDLE_DURATION are
+    the absolute and idle lifetimes of a session, in seconds.
+    """
+    duration = _seconds("SESSION_DURATION")
+    idle = _seconds("SESSION_IDLE_DURATION")
+    if os.getenv("SESSION_STORE") == "sqlite":
+        return SQLiteSessionStore(
+            duration, idle,
+            os.getenv("SESSION_STORE_PATH", ".db_sessions.sqlite"))
+    shards = max(1, int(os.getenv("SESSION_SHARDS", SHARDS)))
+    return ShardedSessionStore(duration, idle, data, shards)
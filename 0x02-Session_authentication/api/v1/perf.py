@@ -0,0 +1,251 @@
+#!/usr/bin/env python3
+"""
+Opt-in hot path instrumentation of the API
+"""
+from flask import request
+import functools
+import inspect
+import random
+import threading
+import time
+
+
+BUCKETS = 32
+PHASES = ("auth", "model", "serialization", "total")
+STATS = None
+LOCAL = threading.local()
+
+
+class Histogram:
+    """ Latency histogram with power of two microsecond buckets
+    """
+    __slots__ = ('counts', 'count', 'total_ns')
+
+    def __init__(self):
+        """ Initialize an empty histogram
+        """
+        self.counts = [0] * BUCKETS
+        self.count = 0
+        self.total_ns = 0
+
+    def add(self, ns: int):
+        """ Record one latency in nanoseconds
+        """
+        bucket = min((ns // 1000).bit_length(), BUCKETS - 1)
+        self.counts[bucket] += 1
+        self.count += 1
+        self.total_ns += ns
+
+    def percentile(self, pct: float) -> int:
+        """ Upper bound in microseconds of the bucket holding pct
+        """
+        rank = pct / 100 * self.count
+        seen = 0
+        for bucket, count in enumerate(self.counts):
+            seen += count
+            if count and seen >= rank:
+                return 1 << bucket
+        return 0
+
+    def to_json(self) -> dict:
+        """ Summary of the histogram
+        """
+        return {
+            "count": self.count,
+            "mean_us": self.total_ns / self.count / 1000 if self.count else 0,
+            "p50_us": self.percentile(50),
+            "p90_us": self.percentile(90),
+            "p99_us": self.percentile(99),
+        }
+
+
+class RequestTimings:
+    """ Phase timings of one sampled request
+    """
+    __slots__ = ('start', 'active', 'phases')
+
+    def __init__(self):
+        """ Start timing a request
+        """
+        self.start = time.perf_counter_ns()
+        self.active = False
+        self.phases = dict.fromkeys(PHASES, 0)
+
+
+class PerfStats:
+    """ Per route and per phase latency histograms
+
+    Only sample_rate of the requests are timed, so the cost of an
+    unsampled request is one random() call.
+    """
+
+    def __init__(self, sample_rate: float = 1.0):
+        """ Initialize empty stats
+        """
+        self.sample_rate = sample_rate
+        self.routes = {}
+        self.lock = threading.Lock()
+
+    def record(self, route: str, timings: RequestTimings):
+        """ Add the timings of one request of route
+        """
+        timings.phases["total"] = time.perf_counter_ns() - timings.start
+        with self.lock:
+            histograms = self.routes.get(route)
+            if histograms is None:
+                histograms = {phase: Histogram() for phase in PHASES}
+                self.routes[route] = histograms
+            for phase, ns in timings.phases.items():
+                histograms[phase].add(ns)
+
+    def to_json(self) -> dict:
+        """ Summary of every route
+        """
+        with self.lock:
+            routes = {route: {phase: hist.to_json()
+                              for phase, hist in histograms.items()}
+                      for route, histograms in self.routes.items()}
+        return {"sample_rate": self.sample_rate, "routes": routes}
+
+
+def current_timings() -> RequestTimings:
+    """ Timings of the sampled request served by this thread, if any
+    """
+    return getattr(LOCAL, "timings", None)
+
+
+def _measure(phase: str, func, *args, **kwargs):
+    """ Call func, adding its duration to phase of the sampled request
+    """
+    timings = current_timings()
+    if timings is None or timings.active:
+        return func(*args, **kwargs)
+    timings.active = True
+    start = time.perf_counter_ns()
+    try:
+        return func(*args, **kwargs)
+    finally:
+        timings.phases[phase] += time.perf_counter_ns() - start
+        timings.active = False
+
+
+def timed(phase: str, func):
+    """ Wrap func to add its duration to phase of the sampled request
+
+    Calls nested in an already timed call are not counted twice: model
+    lookups done while resolving the user count as auth. For a generator
+    function, the time spent producing each item is counted.
+    """
+    if inspect.isgeneratorfunction(func):
+        @functools.wraps(func)
+        def gen_wrapper(*args, **kwargs):
+            items = func(*args, **kwargs)
+            while True:
+                try:
+                    item = _measure(phase, next, items)
+                except StopIteration:
+                    return
+                yield item
+        return gen_wrapper
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        return _measure(phase, func, *args, **kwargs)
+    return wrapper
+
+
+class TimedBody:
+    """ Streamed response body whose iteration is part of the request
+
+    The timings are recorded once the body is exhausted or closed.
+    """
+
+    def __init__(self, body, route: str, timings: RequestTimings):
+        """ Wrap the iterable body of a sampled request of route
+        """
+        self.body = body
+        self.items = iter(body)
+        self.route = route
+        self.timings = timings
+
+    def __iter__(self):
+        """ Iterator over the body
+        """
+        return self
+
+    def __next__(self):
+        """ Next chunk, produced with the request timings current
+        """
+        LOCAL.timings = self.timings
+        try:
+            return next(self.items)
+        except StopIteration:
+            self.close()
+            raise
+        finally:
+            LOCAL.timings = None
+
+    def close(self):
+        """ Close the body and record the timings, once
+        """
+        if self.timings is not None:
+            STATS.record(self.route, self.timings)
+            self.timings = None
+        if hasattr(self.body, "close"):
+            self.body.close()
+
+
+def instrument(target, names, phase: str):
+    """ Time the methods names of a class or an instance under phase
+    """
+    for name in names:
+        attr = inspect.getattr_static(target, name)
+        if isinstance(attr, classmethod):
+            setattr(target, name, classmethod(timed(phase, attr.__func__)))
+        elif isinstance(target, type):
+            setattr(target, name, timed(phase, attr))
+        else:
+            setattr(target, name, timed(phase, getattr(target, name)))
+
+
+def init_app(app, auth, sample_rate: float = 1.0):
+    """ Enable the instrumentation of app and return its stats
+
+    Must run before the other before_request handlers are registered.
+    """
+    global STATS
+    from models.user import User
+    STATS = PerfStats(sample_rate)
+    if auth:
+        instrument(auth, ("require_auth", "authorization_header",
+                          "session_cookie", "current_user"), "auth")
+    instrument(User, ("get", "search", "all", "page", "count", "save",
+                      "remove"), "model")
+    instrument(User, ("to_json", "to_json_bytes"), "serialization")
+
+    @app.before_request
+    def perf_start():
+        """ Start timing a sampled request
+        """
+        sampled = random.random() < STATS.sample_rate
+        LOCAL.timings = RequestTimings() if sampled else None
+
+    @app.after_request
+    def perf_stop(response):
+        """ Record the timings of a sampled request
+
+        A streamed body is produced after this handler: its timings are
+        recorded when it has been sent.
+        """
+        timings = current_timings()
+        LOCAL.timings = None
+        if timings is not None:
+            rule = request.url_rule.rule if request.url_rule else "-"
+            route = "{} {}".format(request.method, rule)
+            if response.is_streamed:
+                response.response = TimedBody(response.response, route,
+                                              timings)
+            else:
+                STATS.record(route, timings)
+        return response
+    return STATS
@@ -26,6 +26,19 @@ def stats() -> str:
     return jsonify(stats)
 
 
+@app_views.route('/stats/perf', strict_slashes=False)
+def perf_stats() -> str:
+    """ GET /api/v1/stats/perf
+    Return:
+      - latency histograms of every route, by phase
+      - 404 if PERF_STATS is not set
+    """
+    from api.v1 import perf
+    if perf.STATS is None:
+        abort(404)
+    return jsonify(perf.STATS.to_json())
+
+
 @app_views.route('/unauthorized', methods=['GET'], strict_slashes=False)
 def unauthorized() -> str:
     """ GET /api/v1/unauthorized
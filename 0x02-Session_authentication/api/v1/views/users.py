@@ -2,18 +2,73 @@
 """ Module of Users views
 """
 from api.v1.views import app_views
-from flask import abort, jsonify, request
+from flask import abort, jsonify, request, Response
 from models.user import User
 
 
+def json_response(body: bytes, status: int = 200) -> Response:
+    """ Response of an already encoded JSON body
+    """
+    return Response(body + b"\n", status=status, mimetype="application/json")
+
+
+def stream_users(users, ndjson: bool):
+    """ Yield the JSON array, or the NDJSON lines, of users
+    """
+    if ndjson:
+        for user in users:
+            yield user.to_json_bytes() + b"\n"
+        return
+    sep = b"["
+    for user in users:
+        yield sep + user.to_json_bytes()
+        sep = b","
+    yield b"[]\n" if sep == b"[" else b"]\n"
+
+
 @app_views.route('/users', methods=['GET'], strict_slashes=False)
 def view_all_users() -> str:
     """ GET /api/v1/users
+    Query parameters (optional):
+      - limit: max number of users, in id order
+      - after: id of the last user of the previous page
+      - stream: "json" or "ndjson" to stream the response
     Return:
       - list of all User objects JSON represented
+      - X-Next-After header holding the cursor of the next page
+      - 400 if limit or stream is invalid
     """
-    all_users = [user.to_json() for user in User.all()]
-    return jsonify(all_users), 200
+    limit = request.args.get('limit')
+    after = request.args.get('after')
+    stream = request.args.get('stream')
+    if limit is not None:
+        try:
+            limit = int(limit)
+            if limit < 0:
+                raise ValueError
+        except ValueError:
+            return jsonify({'error': "Wrong limit"}), 400
+    if stream not in (None, "json", "ndjson"):
+        return jsonify({'error': "Wrong stream"}), 400
+
+    if stream and limit is None:
+        users = User.page(after)
+    elif limit is None and after is None:
+        users = User.all()
+    else:
+        users = list(User.page(after, limit))
+    headers = {}
+    if limit and len(users) == limit:
+        headers['X-Next-After'] = users[-1].id
+    if stream:
+        mimetype = "application/x-ndjson" if stream == "ndjson" \
+            else "application/json"
+        return Response(stream_users(users, stream == "ndjson"),
+                        mimetype=mimetype, headers=headers)
+    all_users = b",".join(user.to_json_bytes() for user in users)
+    resp = json_response(b"[" + all_users + b"]")
+    resp.headers.extend(headers)
+    return resp
 
 
 @app_views.route('/users/<user_id>', methods=['GET'], strict_slashes=False)
@@ -29,14 +84,14 @@ def view_one_user(user_id: str = None) -> str:
     if user_id == 'me' and current_user is None:
         abort(404)
     if user_id == 'me' and current_user:
-        return jsonify(current_user.to_json()), 200
+        return json_response(current_user.to_json_bytes())
 
     if user_id is None:
         abort(404)
     user = User.get(user_id)
     if user is None:
         abort(404)
-    return jsonify(user.to_json()), 200
+    return json_response(user.to_json_bytes())
 
 
 @app_views.route('/users/<user_id>', methods=['DELETE'], strict_slashes=False)
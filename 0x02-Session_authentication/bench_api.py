@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+""" Local load benchmark of the v1 API
+
+Seed a file store with N users, start the API of a project directory
+(0x01 or 0x02) on a local port for each AUTH_TYPE, drive its user and
+session endpoints from concurrent client threads and report throughput
+and p50/p99/p999 latency for every user count and concurrency:
+
+    ./bench_api.py --users 100 10000 --concurrency 1 8 32
+    ./bench_api.py --project ../0x01-Basic_authentication --auth basic_auth
+"""
+import argparse
+import base64
+import hashlib
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+import uuid
+
+SESSION_NAME = "_my_session_id"
+PASSWORD = "bench pwd"
+
+
+def seed_users(directory: str, count: int) -> list:
+    """ Write count users to .db_User.json in directory, return emails
+    """
+    now = time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime())
+    password = hashlib.sha256(PASSWORD.encode()).hexdigest().lower()
+    users = {}
+    emails = []
+    for i in range(count):
+        user_id = str(uuid.uuid4())
+        email = "user{}@bench.io".format(i)
+        users[user_id] = {
+            "id": user_id, "created_at": now, "updated_at": now,
+            "email": email, "_password": password,
+            "first_name": "Bench", "last_name": str(i)}
+        emails.append(email)
+    with open(os.path.join(directory, ".db_User.json"), "w") as f:
+        json.dump(users, f)
+    return emails
+
+
+def free_port() -> int:
+    """ Pick a free local TCP port
+    """
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_api(project: str, directory: str, auth_type: str):
+    """ Start the API of project with its store in directory
+    """
+    port = free_port()
+    env = dict(os.environ, AUTH_TYPE=auth_type, SESSION_NAME=SESSION_NAME,
+               API_HOST="127.0.0.1", API_PORT=str(port),
+               PYTHONPATH=os.path.abspath(project))
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "api.v1.app"], cwd=directory, env=env,
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    base_url = "http://127.0.0.1:{}/api/v1".format(port)
+    for _ in range(200):
+        try:
+            urllib.request.urlopen(base_url + "/status", timeout=1)
+            return proc, base_url
+        except (urllib.error.URLError, ConnectionError):
+            if proc.poll() is not None:
+                break
+            time.sleep(0.05)
+    proc.kill()
+    raise RuntimeError("API of {} did not start".format(project))
+
+
+def call(method: str, url: str, headers: dict = None, data: dict = None):
+    """ Send one request, return its status and response
+    """
+    body = urllib.parse.urlencode(data).encode() if data else None
+    req = urllib.request.Request(url, body, headers or {}, method=method)
+    try:
+        with urllib.request.urlopen(req, timeout=30) as resp:
+            resp.read()
+            return resp.status, resp
+    except urllib.error.HTTPError as e:
+        return e.code, e
+
+
+def basic_header(email: str) -> dict:
+    """ Basic Authorization header of a seeded user
+    """
+    token = base64.b64encode("{}:{}".format(email, PASSWORD).encode())
+    return {"Authorization": "Basic " + token.decode()}
+
+
+def login(base_url: str, email: str) -> dict:
+    """ Log a seeded user in, return the session cookie header
+    """
+    status, resp = call("POST", base_url + "/auth_session/login",
+                        data={"email": email, "password": PASSWORD})
+    if status != 200:
+        return None
+    cookie = resp.headers.get("Set-Cookie", "").split(";")[0]
+    return {"Cookie": cookie}
+
+
+def scenarios(base_url: str, auth_type: str, has_me: bool) -> dict:
+    """ Name -> function(email, headers) of each timed operation
+    """
+    def get(path):
+        def run(email, headers):
+            return call("GET", base_url + path, headers)[0]
+        return run
+
+    result = {"GET /users": get("/users")}
+    if has_me:
+        result["GET /users/me"] = get("/users/me")
+    if auth_type == "session_auth":
+        result["POST /auth_session/login"] = \
+            lambda email, headers: 200 if login(base_url, email) else 401
+        result["login + logout"] = \
+            lambda email, headers: call(
+                "DELETE", base_url + "/auth_session/logout",
+                login(base_url, email))[0]
+    return result
+
+
+def drive(run, emails: list, auth_type: str, base_url: str,
+          concurrency: int, requests: int) -> dict:
+    """ Run requests calls of run on concurrency threads, time them
+    """
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+
+    def worker(i: int):
+        email = emails[i % len(emails)]
+        if auth_type == "basic_auth":
+            headers = basic_header(email)
+        else:
+            headers = login(base_url, email)
+        mine = []
+        failed = 0
+        for _ in range(requests // concurrency):
+            start = time.perf_counter()
+            if run(email, headers) >= 400:
+                failed += 1
+            mine.append(time.perf_counter() - start)
+        with lock:
+            latencies.extend(mine)
+            errors[0] += failed
+
+    threads = [threading.Thread(target=worker, args=(i,))
+               for i in range(concurrency)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+
+    def pct(p):
+        if not latencies:
+            return 0.0
+        rank = min(len(latencies) - 1, int(p / 100 * len(latencies)))
+        return latencies[rank] * 1000
+
+    return {"requests": len(latencies), "errors": errors[0],
+            "req_per_sec": len(latencies) / elapsed if elapsed else 0.0,
+            "p50_ms": pct(50), "p99_ms": pct(99), "p999_ms": pct(99.9)}
+
+
+def main():
+    """ Parse arguments and run the benchmark matrix
+    """
+    here = os.path.dirname(os.path.abspath(__file__))
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--project", default=here)
+    parser.add_argument("--auth", nargs="+",
+                        default=["basic_auth", "session_auth"])
+    parser.add_argument("--users", type=int, nargs="+", default=[100, 10000])
+    parser.add_argument("--concurrency", type=int, nargs="+",
+                        default=[1, 8, 32])
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("-o", "--output", help="write JSON results here")
+    args = parser.parse_args()
+
+    project = os.path.abspath(args.project)
+    has_me = os.path.exists(
+        os.path.join(project, "api", "v1", "auth", "session_auth.py"))
+    results = []
+    for auth_type in args.auth:
+        for users in args.users:
+            with tempfile.TemporaryDirectory() as directory:
+                emails = seed_users(directory, users)
+                proc, base_url = start_api(project, directory, auth_type)
+                try:
+                    runs = scenarios(base_url, auth_type, has_me)
+                    for name, run in runs.items():
+                        for concurrency in args.concurrency:
+                            res = drive(run, emails, auth_type, base_url,
+                                        concurrency, args.requests)
+                            res.update(auth=auth_type, users=users,
+                                       concurrency=concurrency,
+                                       endpoint=name)
+                            results.append(res)
+                            print("{auth:<12} users={users:<7} "
+                                  "c={concurrency:<3} {endpoint:<28} "
+                                  "{req_per_sec:>8.1f} req/s  "
+                                  "p50={p50_ms:.1f}ms p99={p99_ms:.1f}ms "
+                                  "p999={p999_ms:.1f}ms "
+                                  "errors={errors}".format(**res))
+                finally:
+                    proc.terminate()
+                    proc.wait()
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+""" Stress and scaling check of the sharded session store
+
+Hammer ShardedSessionStore from many threads, check that no create or
+destroy is lost, then report read throughput per thread count, next to
+a single shard store (one global lock). Exits with status 1 when the
+check fails. --control runs the same check on an unlocked store first,
+to show it can catch races:
+
+    ./bench_sessions.py --threads 1 2 4 8 --reads 200000 --control
+"""
+import argparse
+import sys
+import threading
+import time
+import uuid
+from api.v1.auth.session_store import (
+    MemorySessionStore, ShardedSessionStore)
+
+
+def run_threads(count: int, target, *args) -> float:
+    """ Run target(i, *args) on count threads, return the elapsed time
+    """
+    threads = [threading.Thread(target=target, args=(i,) + args)
+               for i in range(count)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return time.perf_counter() - start
+
+
+def check_no_lost_updates(store, threads: int, sessions: int) -> list:
+    """ Race creates, lookups and destroys, return the problems found
+
+    Every thread creates its sessions, then destroys half of them while
+    looking up the sessions of the next thread. Lookups refresh the idle
+    deadline, a read then write of the expiry state that resurrects it
+    for a destroyed session unless get and delete are serialized.
+    """
+    created = [None] * threads
+    barrier = threading.Barrier(threads)
+
+    def work(i: int):
+        mine = [str(uuid.uuid4()) for _ in range(sessions)]
+        for session_id in mine:
+            store.set(session_id, "user-{}".format(i))
+        created[i] = mine
+        barrier.wait()
+        neighbour = created[(i + 1) % threads]
+        try:
+            for n, session_id in enumerate(mine[::2]):
+                store.get(neighbour[(2 * n) % sessions])
+                if not store.delete(session_id):
+                    problems.append("delete lost: {}".format(session_id))
+        except Exception as e:
+            problems.append("thread {} failed: {!r}".format(i, e))
+
+    problems = []
+    switch_interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    try:
+        run_threads(threads, work)
+    finally:
+        sys.setswitchinterval(switch_interval)
+    kept = {session_id: "user-{}".format(i)
+            for i, ids in enumerate(created) for session_id in ids[1::2]}
+    if len(store.data) != len(kept):
+        problems.append("{} sessions stored, {} expected".format(
+            len(store.data), len(kept)))
+    for session_id, user_id in kept.items():
+        if store.get(session_id) != user_id:
+            problems.append("session lost: {}".format(session_id))
+    for shard in getattr(store, "shards", [store]):
+        leaked = set(shard.times) - set(store.data)
+        if leaked:
+            problems.append("{} destroyed sessions keep expiry state"
+                            .format(len(leaked)))
+    return problems
+
+
+def read_throughput(store, session_ids, threads: int, reads: int) -> float:
+    """ Reads per second of threads threads doing reads lookups each
+    """
+    def work(i: int):
+        get = store.get
+        count = len(session_ids)
+        for n in range(reads):
+            get(session_ids[(i * 7919 + n) % count])
+    elapsed = run_threads(threads, work)
+    return threads * reads / elapsed
+
+
+def main():
+    """ Parse arguments and run the checks
+    """
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--threads", type=int, nargs="+",
+                        default=[1, 2, 4, 8])
+    parser.add_argument("--sessions", type=int, default=10000)
+    parser.add_argument("--reads", type=int, default=100000)
+    parser.add_argument("--shards", type=int, default=16)
+    parser.add_argument("--control", action="store_true",
+                        help="also check an unlocked MemorySessionStore")
+    args = parser.parse_args()
+
+    threads = max(args.threads + [2])
+    if args.control:
+        problems = check_no_lost_updates(
+            MemorySessionStore(3600, 3600), threads, args.sessions)
+        print("control, unlocked store: {}".format(
+            "; ".join(problems[:3]) if problems else "no race caught"))
+    problems = check_no_lost_updates(
+        ShardedSessionStore(3600, 3600, shards=args.shards),
+        threads, args.sessions)
+    if problems:
+        print("lost updates: {}".format("; ".join(problems[:3])))
+        sys.exit(1)
+    print("no lost updates: {} threads, {} sessions each".format(
+        threads, args.sessions))
+    stores = {
+        "sharded": ShardedSessionStore(shards=args.shards),
+        "global lock": ShardedSessionStore(shards=1),
+    }
+    session_ids = [str(uuid.uuid4()) for _ in range(args.sessions)]
+    for store in stores.values():
+        for session_id in session_ids:
+            store.set(session_id, "user")
+    for threads in args.threads:
+        line = ["threads={:<3}".format(threads)]
+        for name, store in stores.items():
+            rate = read_throughput(store, session_ids, threads, args.reads)
+            line.append("{}: {:>10.0f} reads/s".format(name, rate))
+        print("  ".join(line))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,20 +1,212 @@
 #!/usr/bin/env python3
 """ Base module
 """
+from bisect import bisect_left, bisect_right, insort
+from calendar import timegm
 from datetime import datetime
+from functools import lru_cache
 from typing import TypeVar, List, Iterable
-from os import path
+from os import getenv, path
+from models.snapshot import (
+    LazyObjects, load_json, load_snapshot, write_snapshot)
+import atexit
 import json
+import os
+import sys
+import threading
+import time
 import uuid
 
 
 TIMESTAMP_FORMAT = "%Y-%m-%dT%H:%M:%S"
 DATA = {}
+INDEXES = {}
+INDEX_LOCKS = {}
+STORAGE_MODE = getenv("MODEL_STORAGE", "snapshot")
+JOURNAL_THRESHOLD = int(getenv("MODEL_JOURNAL_THRESHOLD", "10000"))
+JOURNAL_LOCK = threading.Lock()
+JOURNAL_SIZES = {}
+COMPACTING = set()
+GROUP_WINDOW = float(getenv("MODEL_GROUP_WINDOW", "0.01"))
+GROUP_MAX_PENDING = int(getenv("MODEL_GROUP_MAX_PENDING", "100"))
+GROUP_COMMITS = {}
+LOAD_MODE = getenv("MODEL_LOAD", "eager")
+SORTED_IDS = {}
+
+
+class HashIndex():
+    """ Hash index of object ids by the value of one attribute
+
+    A value held by a single object maps straight to its id, and only
+    values shared by several objects map to a dict of ids.
+    """
+
+    def __init__(self, attribute: str):
+        """ Initialize an empty index on attribute
+        """
+        self.attribute = attribute
+        self.ids_by_value = {}
+        self.value_by_id = {}
+
+    def add(self, obj: TypeVar('Base')):
+        """ Index obj under its current attribute value
+        """
+        self.add_value(obj.id, getattr(obj, self.attribute, None))
+
+    def add_value(self, obj_id: str, value):
+        """ Index obj_id under value
+        """
+        self.discard(obj_id)
+        ids = self.ids_by_value.get(value)
+        if ids is None:
+            self.ids_by_value[value] = obj_id
+        elif type(ids) is dict:
+            ids[obj_id] = None
+        else:
+            self.ids_by_value[value] = {ids: None, obj_id: None}
+        self.value_by_id[obj_id] = value
+
+    def discard(self, obj_id: str):
+        """ Drop obj_id from the index
+        """
+        if obj_id not in self.value_by_id:
+            return
+        value = self.value_by_id.pop(obj_id)
+        ids = self.ids_by_value[value]
+        if type(ids) is dict:
+            del ids[obj_id]
+            if ids:
+                return
+        del self.ids_by_value[value]
+
+    def lookup(self, value) -> List[str]:
+        """ Return the ids of objects whose attribute equals value
+        """
+        ids = self.ids_by_value.get(value)
+        if ids is None:
+            return []
+        if type(ids) is dict:
+            return list(ids)
+        return [ids]
+
+
+def _serialize(objs) -> dict:
+    """ JSON of every object of objs, by id
+    """
+    if isinstance(objs, LazyObjects):
+        return {obj_id: objs.serialized(obj_id) for obj_id in objs}
+    return {obj_id: obj.to_json(True) for obj_id, obj in list(objs.items())}
+
+
+class CommitAck(threading.Event):
+    """ Set once the write it acknowledges is on disk
+
+    error holds the exception raised by the write, if any.
+    """
+    error = None
+
+
+class GroupCommit():
+    """ Coalesce the snapshot writes of one class
+
+    Pending writes are persisted together GROUP_WINDOW seconds after the
+    first one, or as soon as GROUP_MAX_PENDING of them are waiting.
+    """
+
+    def __init__(self, model: type):
+        """ Initialize the group commit of model
+        """
+        self.model = model
+        self.lock = threading.Lock()
+        self.write_lock = threading.Lock()
+        self.ack = None
+        self.pending = 0
+        self.timer = None
+
+    def request(self) -> CommitAck:
+        """ Register one dirty write and return its acknowledgement
+        """
+        with self.lock:
+            if self.ack is None:
+                self.ack = CommitAck()
+                self.timer = threading.Timer(GROUP_WINDOW, self.flush)
+                self.timer.daemon = True
+                self.timer.start()
+            self.pending += 1
+            ack = self.ack
+            full = self.pending >= GROUP_MAX_PENDING
+        if full:
+            self.flush()
+        return ack
+
+    def flush(self):
+        """ Persist every pending write with one atomic file write
+        """
+        with self.write_lock:
+            with self.lock:
+                ack, self.ack = self.ack, None
+                self.pending = 0
+                if self.timer is not None:
+                    self.timer.cancel()
+                    self.timer = None
+            if ack is None:
+                return
+            try:
+                self.model.save_to_file()
+            except Exception as e:
+                ack.error = e
+            finally:
+                ack.set()
+
+
+def _flush_group_commits():
+    """ Persist the pending writes of every class at exit
+    """
+    for group in list(GROUP_COMMITS.values()):
+        group.flush()
+
+
+atexit.register(_flush_group_commits)
+
+
+@lru_cache(maxsize=4096)
+def _parse_timestamp(value: str) -> int:
+    """ Convert a TIMESTAMP_FORMAT string to UTC seconds
+
+    Cached, so objects saved in the same second share one int.
+    """
+    return timegm(time.strptime(value, TIMESTAMP_FORMAT))
+
+
+def _to_timestamp(value) -> int:
+    """ Convert a datetime or a TIMESTAMP_FORMAT string to UTC seconds
+    """
+    if isinstance(value, str):
+        return _parse_timestamp(value)
+    return timegm(value.utctimetuple())
+
+
+def _intern(value):
+    """ Intern value when it is a string
+    """
+    return sys.intern(value) if type(value) is str else value
 
 
 class Base():
     """ Base class
+
+    Attributes live in __slots__ and timestamps are kept as integer UTC
+    seconds, which is all TIMESTAMP_FORMAT can represent anyway. DATA is
+    keyed by the id string of each object, so it is stored only once.
+    json_attributes lists the attributes of to_json, in order.
+
+    to_json results and their encoded bytes are cached per object until
+    the next attribute write, which includes the one done by save().
+    Constructors bypass that hook since they have no cache to drop.
     """
+    __slots__ = ('id', '_created_at', '_updated_at', '_json_cache')
+    json_attributes = ('id', 'created_at', 'updated_at')
+    indexed_attributes = ()
 
     def __init__(self, *args: list, **kwargs: dict):
         """ Initialize a Base instance
@@ -23,17 +215,53 @@ class Base():
         if DATA.get(s_class) is None:
             DATA[s_class] = {}
 
-        self.id = kwargs.get('id', str(uuid.uuid4()))
+        # Written around __setattr__: a new object has no cache to drop
+        set_attribute = object.__setattr__
+        set_attribute(self, '_json_cache', None)
+        set_attribute(self, 'id', kwargs.get('id', str(uuid.uuid4())))
         if kwargs.get('created_at') is not None:
-            self.created_at = datetime.strptime(kwargs.get('created_at'),
-                                                TIMESTAMP_FORMAT)
+            created_at = _to_timestamp(kwargs.get('created_at'))
         else:
-            self.created_at = datetime.utcnow()
+            created_at = int(time.time())
         if kwargs.get('updated_at') is not None:
-            self.updated_at = datetime.strptime(kwargs.get('updated_at'),
-                                                TIMESTAMP_FORMAT)
+            updated_at = _to_timestamp(kwargs.get('updated_at'))
         else:
-            self.updated_at = datetime.utcnow()
+            updated_at = int(time.time())
+        if updated_at == created_at:
+            updated_at = created_at
+        set_attribute(self, '_created_at', created_at)
+        set_attribute(self, '_updated_at', updated_at)
+
+    def __setattr__(self, name: str, value):
+        """ Set an attribute and drop the cached JSON
+        """
+        object.__setattr__(self, name, value)
+        if name != '_json_cache':
+            object.__setattr__(self, '_json_cache', None)
+
+    @property
+    def created_at(self) -> datetime:
+        """ Getter of the creation date
+        """
+        return datetime.utcfromtimestamp(self._created_at)
+
+    @created_at.setter
+    def created_at(self, value: datetime):
+        """ Setter of the creation date
+        """
+        self._created_at = _to_timestamp(value)
+
+    @property
+    def updated_at(self) -> datetime:
+        """ Getter of the last update date
+        """
+        return datetime.utcfromtimestamp(self._updated_at)
+
+    @updated_at.setter
+    def updated_at(self, value: datetime):
+        """ Setter of the last update date
+        """
+        self._updated_at = _to_timestamp(value)
 
     def __eq__(self, other: TypeVar('Base')) -> bool:
         """ Equality
@@ -44,11 +272,48 @@ class Base():
             return False
         return (self.id == other.id)
 
+    def _cached_json(self, for_serialization: bool) -> dict:
+        """ Return the cache dict of the object, holding for_serialization
+
+        Callers must keep using the returned dict: a concurrent attribute
+        write may replace _json_cache meanwhile.
+        """
+        cache = self._json_cache
+        if cache is None:
+            cache = {}
+            object.__setattr__(self, '_json_cache', cache)
+        if for_serialization not in cache:
+            cache[for_serialization] = self._build_json(for_serialization)
+        return cache
+
     def to_json(self, for_serialization: bool = False) -> dict:
         """ Convert the object a JSON dictionary
         """
+        return dict(self._cached_json(for_serialization)[for_serialization])
+
+    def to_json_bytes(self) -> bytes:
+        """ Encoded to_json(), formatted like flask.jsonify does
+        """
+        cache = self._cached_json(False)
+        if 'bytes' not in cache:
+            cache['bytes'] = json.dumps(
+                cache[False], separators=(",", ":"), sort_keys=True).encode()
+        return cache['bytes']
+
+    def _build_json(self, for_serialization: bool) -> dict:
+        """ Build the JSON dictionary of to_json
+        """
         result = {}
-        for key, value in self.__dict__.items():
+        for key in self.json_attributes:
+            if not for_serialization and key[0] == '_':
+                continue
+            if key == 'created_at' or key == 'updated_at':
+                seconds = getattr(self, '_' + key)
+                result[key] = time.strftime(TIMESTAMP_FORMAT,
+                                            time.gmtime(seconds))
+            else:
+                result[key] = getattr(self, key)
+        for key, value in getattr(self, '__dict__', {}).items():
             if not for_serialization and key[0] == '_':
                 continue
             if type(value) is datetime:
@@ -57,49 +322,222 @@ class Base():
                 result[key] = value
         return result
 
+    @classmethod
+    def _index_lock(cls) -> threading.Lock:
+        """ Return the lock guarding the indexes of the class
+
+        Index updates read and then write shared entries, so concurrent
+        saves of objects sharing a value must not interleave.
+        """
+        return INDEX_LOCKS.setdefault(cls.__name__, threading.Lock())
+
+    @classmethod
+    def _indexes(cls) -> dict:
+        """ Return the secondary indexes of the class, by attribute
+        """
+        s_class = cls.__name__
+        if INDEXES.get(s_class) is None:
+            with cls._index_lock():
+                if INDEXES.get(s_class) is None:
+                    INDEXES[s_class] = cls._build_indexes()
+        return INDEXES[s_class]
+
+    @classmethod
+    def _build_indexes(cls) -> dict:
+        """ Index every loaded object of the class
+        """
+        indexes = {attr: HashIndex(attr) for attr in cls.indexed_attributes}
+        objs = DATA.get(cls.__name__, {})
+        if isinstance(objs, LazyObjects):
+            for obj_id in objs:
+                for attr, index in indexes.items():
+                    index.add_value(obj_id, objs.indexed_value(obj_id, attr))
+        else:
+            for obj in list(objs.values()):
+                for index in indexes.values():
+                    index.add(obj)
+        return indexes
+
     @classmethod
     def load_from_file(cls):
         """ Load all objects from file
+
+        With MODEL_LOAD=lazy only the indexed attributes are read up
+        front and objects are built on first access. MODEL_LOAD=mmap
+        does the same from the memory-mapped .db_<Class>.snap binary
+        snapshot, which then replaces the JSON file for every write.
         """
         s_class = cls.__name__
         file_path = ".db_{}.json".format(s_class)
+        snapshot_path = ".db_{}.snap".format(s_class)
         DATA[s_class] = {}
-        if not path.exists(file_path):
-            return
+        INDEXES.pop(s_class, None)
+        SORTED_IDS.pop(s_class, None)
+        if LOAD_MODE == "mmap" and path.exists(snapshot_path):
+            DATA[s_class] = load_snapshot(cls, snapshot_path)
+        elif LOAD_MODE != "eager" and path.exists(file_path):
+            DATA[s_class] = load_json(cls, file_path)
+        elif path.exists(file_path):
+            with open(file_path, 'r') as f:
+                objs_json = json.load(f)
+                for obj_json in objs_json.values():
+                    # Key by the id of the object to store the string once
+                    obj = cls(**obj_json)
+                    DATA[s_class][obj.id] = obj
+        journal_path = ".db_{}.journal".format(s_class)
+        compacting_path = journal_path + ".compacting"
+        cls._replay_journal(compacting_path)
+        JOURNAL_SIZES[s_class] = cls._replay_journal(journal_path)
+        if path.exists(compacting_path):
+            # Left by a crash during compaction: finish it now, before a
+            # rotation can overwrite it
+            cls._write_snapshot(_serialize(DATA[s_class]))
+            os.remove(compacting_path)
+        cls._indexes()
+
+    @classmethod
+    def _replay_journal(cls, journal_path: str) -> int:
+        """ Apply the entries of a journal file on top of DATA
+
+        Return the number of entries applied. A truncated last entry,
+        left by a crash in the middle of an append, is ignored.
+        """
+        s_class = cls.__name__
+        if not path.exists(journal_path):
+            return 0
+        count = 0
+        with open(journal_path, 'r') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    break
+                if entry["op"] == "save":
+                    obj = cls(**entry["obj"])
+                    DATA[s_class][obj.id] = obj
+                else:
+                    DATA[s_class].pop(entry["id"], None)
+                count += 1
+        return count
+
+    @classmethod
+    def append_to_journal(cls, op: str, obj_id: str, obj_json: dict = None):
+        """ Append one save or remove entry to the journal of the class
+
+        Once the journal holds JOURNAL_THRESHOLD entries it is rotated
+        and compacted into the snapshot file by a background thread.
+        """
+        s_class = cls.__name__
+        journal_path = ".db_{}.journal".format(s_class)
+        entry = json.dumps({"op": op, "id": obj_id, "obj": obj_json})
+        objs = None
+        with JOURNAL_LOCK:
+            with open(journal_path, 'a') as f:
+                f.write(entry + "\n")
+            JOURNAL_SIZES[s_class] = JOURNAL_SIZES.get(s_class, 0) + 1
+            if JOURNAL_SIZES[s_class] >= JOURNAL_THRESHOLD \
+                    and s_class not in COMPACTING:
+                COMPACTING.add(s_class)
+                # A journal left by a failed compaction is compacted
+                # again before the current one is rotated
+                if not path.exists(journal_path + ".compacting"):
+                    os.replace(journal_path, journal_path + ".compacting")
+                    JOURNAL_SIZES[s_class] = 0
+                objs = DATA[s_class].copy()
+        if objs is not None:
+            threading.Thread(target=cls._compact, args=(objs,),
+                             daemon=True).start()
 
-        with open(file_path, 'r') as f:
-            objs_json = json.load(f)
-            for obj_id, obj_json in objs_json.items():
-                DATA[s_class][obj_id] = cls(**obj_json)
+    @classmethod
+    def _compact(cls, objs: dict):
+        """ Write objs as the new snapshot and drop the rotated journal
+        """
+        s_class = cls.__name__
+        try:
+            cls._write_snapshot(_serialize(objs))
+            os.remove(".db_{}.journal.compacting".format(s_class))
+        finally:
+            COMPACTING.discard(s_class)
+
+    @classmethod
+    def _write_snapshot(cls, objs_json: dict):
+        """ Atomically replace the snapshot file of the class
+        """
+        s_class = cls.__name__
+        if LOAD_MODE == "mmap":
+            write_snapshot(".db_{}.snap".format(s_class), objs_json,
+                           cls.indexed_attributes)
+            return
+        file_path = ".db_{}.json".format(s_class)
+        tmp_path = "{}.tmp{}".format(file_path, threading.get_ident())
+        with open(tmp_path, 'w') as f:
+            json.dump(objs_json, f)
+        os.replace(tmp_path, file_path)
 
     @classmethod
     def save_to_file(cls):
         """ Save all objects to file
         """
         s_class = cls.__name__
-        file_path = ".db_{}.json".format(s_class)
-        objs_json = {}
-        for obj_id, obj in DATA[s_class].items():
-            objs_json[obj_id] = obj.to_json(True)
+        cls._write_snapshot(_serialize(DATA[s_class]))
+        journal_path = ".db_{}.journal".format(s_class)
+        if STORAGE_MODE != "journal" and path.exists(journal_path):
+            os.remove(journal_path)
 
-        with open(file_path, 'w') as f:
-            json.dump(objs_json, f)
+    @classmethod
+    def _persist(cls) -> CommitAck:
+        """ Persist DATA of the class, grouped when MODEL_STORAGE=group
+
+        Return the acknowledgement to wait on in group mode.
+        """
+        if STORAGE_MODE != "group":
+            cls.save_to_file()
+            return None
+        s_class = cls.__name__
+        if GROUP_COMMITS.get(s_class) is None:
+            GROUP_COMMITS[s_class] = GroupCommit(cls)
+        return GROUP_COMMITS[s_class].request()
 
     def save(self):
         """ Save current object
+
+        Return the durability acknowledgement in group mode.
         """
         s_class = self.__class__.__name__
-        self.updated_at = datetime.utcnow()
+        self._updated_at = int(time.time())
+        if self.id not in DATA[s_class] and s_class in SORTED_IDS:
+            insort(SORTED_IDS[s_class], self.id)
         DATA[s_class][self.id] = self
-        self.__class__.save_to_file()
+        indexes = self.__class__._indexes()
+        with self.__class__._index_lock():
+            for index in indexes.values():
+                index.add(self)
+        if STORAGE_MODE == "journal":
+            self.__class__.append_to_journal(
+                "save", self.id, self.to_json(True))
+            return None
+        return self.__class__._persist()
 
     def remove(self):
         """ Remove object
+
+        Return the durability acknowledgement in group mode.
         """
         s_class = self.__class__.__name__
         if DATA[s_class].get(self.id) is not None:
             del DATA[s_class][self.id]
-            self.__class__.save_to_file()
+            ids = SORTED_IDS.get(s_class)
+            if ids is not None:
+                del ids[bisect_left(ids, self.id)]
+            indexes = self.__class__._indexes()
+            with self.__class__._index_lock():
+                for index in indexes.values():
+                    index.discard(self.id)
+            if STORAGE_MODE == "journal":
+                self.__class__.append_to_journal("remove", self.id)
+                return None
+            return self.__class__._persist()
+        return None
 
     @classmethod
     def count(cls) -> int:
@@ -108,6 +546,22 @@ class Base():
         s_class = cls.__name__
         return len(DATA[s_class].keys())
 
+    @classmethod
+    def page(cls, after: str = None,
+             limit: int = None) -> Iterable[TypeVar('Base')]:
+        """ Yield up to limit objects in id order, from after the id after
+        """
+        s_class = cls.__name__
+        if SORTED_IDS.get(s_class) is None:
+            SORTED_IDS[s_class] = sorted(DATA[s_class])
+        ids = SORTED_IDS[s_class]
+        start = 0 if after is None else bisect_right(ids, after)
+        end = None if limit is None else start + limit
+        for obj_id in ids[start:end]:
+            obj = DATA[s_class].get(obj_id)
+            if obj is not None:
+                yield obj
+
     @classmethod
     def all(cls) -> Iterable[TypeVar('Base')]:
         """ Return all objects
@@ -124,6 +578,9 @@ class Base():
     @classmethod
     def search(cls, attributes: dict = {}) -> List[TypeVar('Base')]:
         """ Search all objects with matching attributes
+
+        An indexed attribute of the query narrows the candidates to the
+        objects of its index instead of scanning every object.
         """
         s_class = cls.__name__
         def _search(obj):
@@ -133,5 +590,17 @@ class Base():
                 if (getattr(obj, k) != v):
                     return False
             return True
-        
-        return list(filter(_search, DATA[s_class].values()))
+
+        candidates = DATA[s_class].values()
+        indexes = cls._indexes()
+        for k, v in attributes.items():
+            if k not in indexes:
+                continue
+            try:
+                with cls._index_lock():
+                    ids = indexes[k].lookup(v)
+            except TypeError:
+                continue
+            candidates = [DATA[s_class][obj_id] for obj_id in ids]
+            break
+        return list(filter(_search, candidates))
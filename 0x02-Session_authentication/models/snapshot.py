@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+""" Lazy loading and binary snapshots of model objects
+"""
+from collections.abc import MutableMapping
+from typing import Callable, Iterable, Iterator
+import json
+import mmap
+import os
+import re
+import struct
+import threading
+
+
+SNAPSHOT_MAGIC = b"MDLSNAP1"
+HEADER = struct.Struct("<8sQ")
+WHITESPACE = re.compile(r"[ \t\n\r]*")
+
+
+class LazyObjects(MutableMapping):
+    """ Objects of one class by id, built from their JSON on first access
+
+    Until an object is built, only the tuple of the values of its
+    indexed attributes, in model.indexed_attributes order, and a loader
+    able to fetch its JSON are kept.
+    """
+
+    def __init__(self, model: type, loader: Callable[[str], dict],
+                 attributes: dict):
+        """ Initialize from the indexed attribute values of every id
+        """
+        self.model = model
+        self.loader = loader
+        self.attributes = attributes
+        self.objs = dict.fromkeys(attributes)
+        self.lock = threading.Lock()
+
+    def __getitem__(self, obj_id: str):
+        obj = self.objs[obj_id]
+        if obj is None:
+            with self.lock:
+                obj = self.objs[obj_id]
+                if obj is None:
+                    obj = self.model(**self.loader(obj_id))
+                    self.objs[obj_id] = obj
+                    self.attributes.pop(obj_id, None)
+        return obj
+
+    def __setitem__(self, obj_id: str, obj):
+        self.objs[obj_id] = obj
+        self.attributes.pop(obj_id, None)
+
+    def __delitem__(self, obj_id: str):
+        del self.objs[obj_id]
+        self.attributes.pop(obj_id, None)
+
+    def __iter__(self):
+        return iter(list(self.objs))
+
+    def __len__(self) -> int:
+        return len(self.objs)
+
+    def __contains__(self, obj_id) -> bool:
+        return obj_id in self.objs
+
+    def copy(self) -> 'LazyObjects':
+        """ Shallow copy sharing the loader and the built objects
+        """
+        objs = LazyObjects(self.model, self.loader, dict(self.attributes))
+        objs.objs = dict(self.objs)
+        return objs
+
+    def indexed_value(self, obj_id: str, attribute: str):
+        """ Value of an indexed attribute without building the object
+        """
+        obj = self.objs[obj_id]
+        if obj is None:
+            position = self.model.indexed_attributes.index(attribute)
+            return self.attributes[obj_id][position]
+        return getattr(obj, attribute, None)
+
+    def serialized(self, obj_id: str) -> dict:
+        """ JSON of an object without building it
+        """
+        obj = self.objs[obj_id]
+        if obj is None:
+            return self.loader(obj_id)
+        return obj.to_json(True)
+
+
+def _pack(offset: int, length: int) -> int:
+    """ Pack the offset and length of a record in a single int
+    """
+    return offset << 32 | length
+
+
+def _unpack(packed: int) -> tuple:
+    """ Offset and length of a record packed by _pack
+    """
+    return packed >> 32, packed & 0xFFFFFFFF
+
+
+def _scan_records(text: str) -> Iterator[tuple]:
+    """ Yield (id, start, end, record) for every record of a JSON object
+
+    start and end are the offsets of the record in text.
+    """
+    decoder = json.JSONDecoder()
+    pos = WHITESPACE.match(text, 0).end()
+    if text[pos:pos + 1] != "{":
+        raise ValueError("not a JSON object")
+    pos = WHITESPACE.match(text, pos + 1).end()
+    while text[pos:pos + 1] != "}":
+        obj_id, pos = decoder.raw_decode(text, pos)
+        pos = WHITESPACE.match(text, pos).end()
+        if text[pos:pos + 1] != ":":
+            raise ValueError("expected ':' at {}".format(pos))
+        start = WHITESPACE.match(text, pos + 1).end()
+        record, end = decoder.raw_decode(text, start)
+        yield obj_id, start, end, record
+        pos = WHITESPACE.match(text, end).end()
+        if text[pos:pos + 1] == ",":
+            pos = WHITESPACE.match(text, pos + 1).end()
+
+
+def load_json(model: type, file_path: str) -> LazyObjects:
+    """ Lazily load a .db_<Class>.json file
+
+    The file is scanned once to keep the packed offsets of every record
+    and the values of its indexed attributes; records are parsed again
+    from the memory-mapped file when their object is first built. Files
+    that are not pure ASCII, where offsets in characters and bytes
+    differ, are kept parsed in memory instead.
+    """
+    indexed = model.indexed_attributes
+    attributes = {}
+    with open(file_path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return LazyObjects(model, None, {})
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    data = mm[:]
+    if not data.isascii():
+        objs_json = json.loads(data)
+        for obj_id, obj_json in objs_json.items():
+            attributes[obj_id] = tuple(obj_json.get(a) for a in indexed)
+        return LazyObjects(model, objs_json.__getitem__, attributes)
+    offsets = {}
+    for obj_id, start, end, record in _scan_records(data.decode("ascii")):
+        offsets[obj_id] = _pack(start, end - start)
+        attributes[obj_id] = tuple(record.get(a) for a in indexed)
+    del data
+
+    def loader(obj_id: str) -> dict:
+        offset, length = _unpack(offsets[obj_id])
+        return json.loads(mm[offset:offset + length])
+    return LazyObjects(model, loader, attributes)
+
+
+def write_snapshot(file_path: str, objs_json: dict,
+                   attributes: Iterable[str]):
+    """ Atomically write objs_json as a binary snapshot
+
+    The file starts with SNAPSHOT_MAGIC and the length of a JSON index
+    mapping every id to the offset and length of its record and to the
+    values of its indexed attributes. The JSON records follow the index.
+    """
+    index = {}
+    records = []
+    offset = 0
+    for obj_id, obj_json in objs_json.items():
+        record = json.dumps(obj_json).encode()
+        values = {attr: obj_json.get(attr) for attr in attributes}
+        index[obj_id] = [offset, len(record), values]
+        records.append(record)
+        offset += len(record)
+    index_bytes = json.dumps(index).encode()
+    tmp_path = "{}.tmp{}".format(file_path, threading.get_ident())
+    with open(tmp_path, 'wb') as f:
+        f.write(HEADER.pack(SNAPSHOT_MAGIC, len(index_bytes)))
+        f.write(index_bytes)
+        for record in records:
+            f.write(record)
+    os.replace(tmp_path, file_path)
+
+
+def load_snapshot(model: type, file_path: str) -> LazyObjects:
+    """ Memory-map a binary snapshot and lazily load its objects
+
+    Pages of the mapping are shared by every process that maps the file,
+    including forked workers.
+    """
+    with open(file_path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return LazyObjects(model, None, {})
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    magic, index_len = HEADER.unpack_from(mm, 0)
+    if magic != SNAPSHOT_MAGIC:
+        raise ValueError("{} is not a model snapshot".format(file_path))
+    start = HEADER.size + index_len
+    indexed = model.indexed_attributes
+    offsets = {}
+    attributes = {}
+    for obj_id, (offset, length, values) in json.loads(
+            mm[HEADER.size:start]).items():
+        offsets[obj_id] = _pack(start + offset, length)
+        attributes[obj_id] = tuple(values.get(a) for a in indexed)
+
+    def loader(obj_id: str) -> dict:
+        offset, length = _unpack(offsets[obj_id])
+        return json.loads(mm[offset:offset + length])
+    return LazyObjects(model, loader, attributes)
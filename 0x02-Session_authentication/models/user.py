@@ -2,21 +2,51 @@
 """ User module
 """
 import hashlib
-from models.base import Base
+from models.base import Base, _intern
+
+
+def _pack_digest(value: str):
+    """ Raw bytes of a lowercase hex digest, other values unchanged
+    """
+    try:
+        digest = bytes.fromhex(value)
+    except (TypeError, ValueError):
+        return value
+    return digest if digest.hex() == value else value
 
 
 class User(Base):
     """ User class
     """
+    __slots__ = ('email', '_digest', 'first_name', 'last_name')
+    json_attributes = Base.json_attributes + (
+        'email', '_password', 'first_name', 'last_name')
+    indexed_attributes = ('email',)
 
     def __init__(self, *args: list, **kwargs: dict):
         """ Initialize a User instance
         """
         super().__init__(*args, **kwargs)
-        self.email = kwargs.get('email')
-        self._password = kwargs.get('_password')
-        self.first_name = kwargs.get('first_name')
-        self.last_name = kwargs.get('last_name')
+        set_attribute = object.__setattr__
+        set_attribute(self, 'email', kwargs.get('email'))
+        set_attribute(self, '_digest', _pack_digest(kwargs.get('_password')))
+        set_attribute(self, 'first_name', _intern(kwargs.get('first_name')))
+        set_attribute(self, 'last_name', _intern(kwargs.get('last_name')))
+
+    @property
+    def _password(self) -> str:
+        """ Getter of the SHA256 hex digest of the password
+
+        The digest is kept as 32 raw bytes instead of 64 characters.
+        """
+        digest = self._digest
+        return digest.hex() if type(digest) is bytes else digest
+
+    @_password.setter
+    def _password(self, value: str):
+        """ Setter of the SHA256 hex digest of the password
+        """
+        self._digest = _pack_digest(value)
 
     @property
     def password(self) -> str:
@@ -2,7 +2,7 @@
 """Flask app module
 """
 from flask import Flask, jsonify, request, abort, redirect
-from auth import Auth
+from auth import Auth, HashingOverloaded
 from sqlalchemy.orm.exc import NoResultFound
 from user import User
 
@@ -11,6 +11,22 @@ AUTH = Auth()
 app = Flask(__name__)
 
 
+@app.teardown_appcontext
+def close_db_session(exception=None):
+    """Release the database session of the request
+    """
+    AUTH.close_session()
+
+
+@app.errorhandler(HashingOverloaded)
+def hashing_overloaded(error):
+    """Reject requests quickly while password hashing is saturated
+    """
+    resp = jsonify({"message": "server busy"})
+    resp.headers["Retry-After"] = "1"
+    return resp, 503
+
+
 @app.route("/", methods=["GET"])
 def home():
     """Define the home route
@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+"""ASGI app module
+
+Serves the routes of app.py from an event loop, with database calls and
+password hashing run off the loop, e.g.:
+
+    uvicorn async_app:app --port 5000
+"""
+from auth import AsyncAuth, HashingOverloaded
+from http.cookies import SimpleCookie
+from urllib.parse import parse_qsl
+import json
+import logging
+
+
+AUTH = AsyncAuth()
+ROUTES = {}
+REASONS = {401: "Unauthorized", 403: "Forbidden", 404: "Not Found",
+           405: "Method Not Allowed", 500: "Internal Server Error"}
+
+
+class Request:
+    """Form fields and cookies of an HTTP request
+    """
+
+    def __init__(self, scope: dict, body: bytes):
+        self.form = dict(parse_qsl(body.decode("utf-8"),
+                                   keep_blank_values=True))
+        self.cookies = {}
+        for name, value in scope["headers"]:
+            if name == b"cookie":
+                cookie = SimpleCookie(value.decode("latin-1"))
+                self.cookies.update(
+                    {key: morsel.value for key, morsel in cookie.items()})
+
+
+def route(path: str, method: str):
+    """Register a handler of method requests to path
+    """
+    def decorator(handler):
+        ROUTES[(method, path)] = handler
+        return handler
+    return decorator
+
+
+def jsonify(body: dict, status: int = 200, headers: list = None) -> tuple:
+    """JSON response as (status, headers, body)
+    """
+    headers = [(b"content-type", b"application/json")] + (headers or [])
+    return status, headers, json.dumps(body).encode("utf-8")
+
+
+def abort(status: int) -> tuple:
+    """Error response of status
+    """
+    return jsonify({"error": REASONS[status]}, status)
+
+
+@route("/", "GET")
+async def home(request: Request) -> tuple:
+    """Define the home route
+    """
+    return jsonify({"message": "Bienvenue"})
+
+
+@route("/users", "POST")
+async def users(request: Request) -> tuple:
+    """Handles user creation
+    """
+    email = request.form.get("email")
+    password = request.form.get("password")
+    try:
+        await AUTH.register_user(email, password)
+        return jsonify(dict(email=email, message="user created"))
+    except ValueError:
+        return jsonify({"message": "email already registered"}, 400)
+
+
+@route("/sessions", "POST")
+async def login(request: Request) -> tuple:
+    """Login a user
+    """
+    email = request.form.get("email")
+    password = request.form.get("password")
+    if not await AUTH.valid_login(email, password):
+        return abort(401)
+    session_id = await AUTH.create_session(email)
+    cookie = "session_id={}; Path=/".format(session_id).encode("latin-1")
+    return jsonify({"email": email, "message": "logged in"},
+                   headers=[(b"set-cookie", cookie)])
+
+
+@route("/sessions", "DELETE")
+async def logout(request: Request) -> tuple:
+    """Logout a user
+    """
+    session_id = request.cookies.get("session_id")
+    if session_id:
+        user = await AUTH.get_user_from_session_id(session_id)
+        if user:
+            await AUTH.destroy_session(user.id)
+            return 302, [(b"location", b"/")], b""
+    return abort(403)
+
+
+@route("/profile", "GET")
+async def profile(request: Request) -> tuple:
+    """Get user profile
+    """
+    session_id = request.cookies.get("session_id")
+    if session_id:
+        user = await AUTH.get_user_from_session_id(session_id)
+        if user:
+            return jsonify({"email": user.email})
+    return abort(403)
+
+
+@route("/reset_password", "POST")
+async def get_reset_password_token(request: Request) -> tuple:
+    """Get password reset_token for a user
+    """
+    email = request.form.get("email")
+    if email is not None:
+        try:
+            token = await AUTH.get_reset_password_token(email=email)
+            return jsonify({"email": email, "reset_token": token})
+        except ValueError:
+            pass
+    return abort(403)
+
+
+@route("/reset_password", "PUT")
+async def update_password(request: Request) -> tuple:
+    """Update user password
+    """
+    email = request.form.get("email")
+    token = request.form.get("reset_token")
+    new_passwd = request.form.get("new_password")
+    if all(itm is not None for itm in (email, token, new_passwd)):
+        try:
+            await AUTH.update_password(reset_token=token, password=new_passwd)
+            return jsonify({"email": email, "message": "Password updated"})
+        except ValueError:
+            pass
+    return abort(403)
+
+
+async def lifespan(receive, send):
+    """Answer the startup and shutdown events of the server
+    """
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def app(scope, receive, send):
+    """ASGI entry point
+    """
+    if scope["type"] == "lifespan":
+        return await lifespan(receive, send)
+    if scope["type"] != "http":
+        return
+    body = b""
+    more_body = True
+    while more_body:
+        message = await receive()
+        body += message.get("body", b"")
+        more_body = message.get("more_body", False)
+
+    handler = ROUTES.get((scope["method"], scope["path"]))
+    if handler is not None:
+        try:
+            status, headers, content = await handler(Request(scope, body))
+        except HashingOverloaded:
+            status, headers, content = jsonify(
+                {"message": "server busy"}, 503, [(b"retry-after", b"1")])
+        except Exception:
+            # Answer instead of leaving the server to drop the connection
+            logging.getLogger(__name__).exception(
+                "%s %s failed", scope["method"], scope["path"])
+            status, headers, content = abort(500)
+    elif any(path == scope["path"] for _, path in ROUTES):
+        status, headers, content = abort(405)
+    else:
+        status, headers, content = abort(404)
+    headers.append((b"content-length", str(len(content)).encode()))
+    await send({"type": "http.response.start", "status": status,
+                "headers": headers})
+    await send({"type": "http.response.body", "body": content})
+
+
+if __name__ == "__main__":
+    import uvicorn
+    uvicorn.run(app, host="0.0.0.0", port=5000)
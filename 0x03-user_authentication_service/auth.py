@@ -2,9 +2,15 @@
 """Auth Module
 """
 import bcrypt
-from db import DB
+from concurrent.futures import (
+    Future, ProcessPoolExecutor, ThreadPoolExecutor)
+from db import AsyncDB, DB
 from user import User
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm.exc import NoResultFound
+import asyncio
+import os
+import threading
 import uuid
 
 
@@ -29,12 +35,88 @@ def _hash_password(password: str) -> bytes:
     return bcrypt.hashpw(password.encode("utf-8"), salt=bcrypt.gensalt())
 
 
+def _check_password(password: str, hashed_password: bytes) -> bool:
+    """Check a password against its bcrypt hash
+    """
+    return bcrypt.checkpw(password.encode("utf-8"), hashed_password)
+
+
+class HashingOverloaded(Exception):
+    """Raised when every slot of the password hashing pool is taken
+    """
+
+
+class PasswordHasher:
+    """Run bcrypt on a bounded pool of workers
+
+    At most workers + queue_size calls are running or waiting. Past
+    that, calls raise HashingOverloaded at once instead of queueing.
+    bcrypt releases the GIL, so the default thread pool uses every
+    worker in parallel. A process pool is available too.
+    """
+
+    def __init__(self, workers: int = None, queue_size: int = None,
+                 kind: str = None):
+        """Initialize the pool
+
+        Args:
+            workers (int): HASH_WORKERS env var, CPU count by default
+            queue_size (int): HASH_QUEUE_SIZE env var, 4 * workers by
+                default
+            kind (str): "thread" or "process", HASH_POOL env var
+        """
+        if workers is None:
+            workers = int(os.getenv("HASH_WORKERS", os.cpu_count() or 1))
+        if queue_size is None:
+            queue_size = int(os.getenv("HASH_QUEUE_SIZE", 4 * workers))
+        if kind is None:
+            kind = os.getenv("HASH_POOL", "thread")
+        if kind == "process":
+            self._executor = ProcessPoolExecutor(max_workers=workers)
+        else:
+            self._executor = ThreadPoolExecutor(max_workers=workers)
+        self._slots = threading.BoundedSemaphore(workers + queue_size)
+
+    def submit(self, func, *args) -> Future:
+        """Run func(*args) on the pool
+
+        Raises:
+            HashingOverloaded: if the pool and its queue are full
+        """
+        if not self._slots.acquire(blocking=False):
+            raise HashingOverloaded
+        try:
+            future = self._executor.submit(func, *args)
+        except Exception:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda f: self._slots.release())
+        return future
+
+    def hash(self, password: str) -> bytes:
+        """Hash a password on the pool
+        """
+        return self.submit(_hash_password, password).result()
+
+    def check(self, password: str, hashed_password: bytes) -> bool:
+        """Check a password against its hash on the pool
+        """
+        return self.submit(
+            _check_password, password, hashed_password).result()
+
+
 class Auth:
     """Auth class to interact with the authentication database.
     """
 
     def __init__(self):
         self._db = DB()
+        self._hasher = PasswordHasher()
+
+    def close_session(self) -> None:
+        """Release the database session of the current thread
+        """
+        self._db.remove_session()
 
     def register_user(self, email: str, password: str) -> User:
         """Register a new user.
@@ -45,6 +127,9 @@ class Auth:
 
         Returns:
             User: Newly registered User object
+
+        Raises:
+            ValueError: If the email is already registered
         """
         try:
             # Check if the user already exists
@@ -52,10 +137,16 @@ class Auth:
             raise ValueError(f"User {email} already exists")
         # User doesn't exist, proceed with registration
         except NoResultFound:
-            hashed_password = _hash_password(password)
-            new_user = self._db.add_user(
-                    email=email,
-                    hashed_password=hashed_password)
+            # Do not hold a pooled connection while waiting on bcrypt
+            self.close_session()
+            hashed_password = self._hasher.hash(password)
+            try:
+                new_user = self._db.add_user(
+                        email=email,
+                        hashed_password=hashed_password)
+            except IntegrityError:
+                # Registered concurrently since the lookup above
+                raise ValueError(f"User {email} already exists")
             return new_user
 
     def valid_login(self, email: str, password: str) -> bool:
@@ -71,24 +162,22 @@ class Auth:
         try:
             # Locate user by email
             user = self._db.find_user_by(email=email)
-
-            # Confirm password using bcrypt
-            hashed_password = user.hashed_password
-            provided_password = password.encode('utf-8')
-
-            return bcrypt.checkpw(provided_password, hashed_password)
-
         except NoResultFound:
             # User not found
             return False
 
+        # Confirm password using bcrypt, without holding a connection
+        hashed_password = user.hashed_password
+        self.close_session()
+        return self._hasher.check(password, hashed_password)
+
     def create_session(self, email: str) -> str:
         """Create a session for the user with given email
         """
         try:
             user = self._db.find_user_by(email=email)
             session_id = str(uuid.uuid4())
-            user.session_id = session_id
+            self._db.update_user(user.id, session_id=session_id)
             return session_id
         except NoResultFound:
             return None
@@ -109,8 +198,7 @@ class Auth:
         """Remove session for a given user
         """
         try:
-            user = self._db.find_user_by(id=user_id)
-            user.session_id = None
+            self._db.update_user(user_id, session_id=None)
         except NoResultFound:
             pass
         return None
@@ -121,7 +209,7 @@ class Auth:
         try:
             user = self._db.find_user_by(email=email)
             token = str(uuid.uuid4())
-            user.reset_token = token
+            self._db.update_user(user.id, reset_token=token)
             return token
         except NoResultFound:
             raise ValueError
@@ -131,8 +219,112 @@ class Auth:
         """
         try:
             user = self._db.find_user_by(reset_token=reset_token)
-            user.hashed_password = _hash_password(password)
-            user.reset_token = None
+        except NoResultFound:
+            raise ValueError
+        user_id = user.id
+        self.close_session()
+        hashed_password = self._hasher.hash(password)
+        try:
+            self._db.update_user(
+                user_id, hashed_password=hashed_password, reset_token=None)
         except NoResultFound:
             raise ValueError
         return None
+
+
+class AsyncAuth:
+    """Asyncio version of Auth
+
+    Database calls run on the threads of an AsyncDB and bcrypt on a
+    PasswordHasher, so the event loop only awaits their futures.
+    """
+
+    def __init__(self, db: DB = None):
+        self._db = AsyncDB(db)
+        self._hasher = PasswordHasher()
+
+    async def _hash(self, password: str) -> bytes:
+        """Hash a password on the hashing pool
+        """
+        return await asyncio.wrap_future(
+            self._hasher.submit(_hash_password, password))
+
+    async def _check(self, password: str, hashed_password: bytes) -> bool:
+        """Check a password against its hash on the hashing pool
+        """
+        return await asyncio.wrap_future(
+            self._hasher.submit(_check_password, password, hashed_password))
+
+    async def register_user(self, email: str, password: str) -> User:
+        """Register a new user, see Auth.register_user
+        """
+        try:
+            await self._db.find_user_by(email=email)
+            raise ValueError(f"User {email} already exists")
+        except NoResultFound:
+            hashed_password = await self._hash(password)
+            try:
+                return await self._db.add_user(
+                    email=email, hashed_password=hashed_password)
+            except IntegrityError:
+                raise ValueError(f"User {email} already exists")
+
+    async def valid_login(self, email: str, password: str) -> bool:
+        """Validate user login credentials, see Auth.valid_login
+        """
+        try:
+            user = await self._db.find_user_by(email=email)
+        except NoResultFound:
+            return False
+        return await self._check(password, user.hashed_password)
+
+    async def create_session(self, email: str) -> str:
+        """Create a session for the user with given email
+        """
+        try:
+            user = await self._db.find_user_by(email=email)
+            session_id = str(uuid.uuid4())
+            await self._db.update_user(user.id, session_id=session_id)
+            return session_id
+        except NoResultFound:
+            return None
+
+    async def get_user_from_session_id(self, session_id: str) -> User:
+        """Get user from a given session_id
+        """
+        if session_id is None:
+            return None
+        try:
+            return await self._db.find_user_by(session_id=session_id)
+        except NoResultFound:
+            return None
+
+    async def destroy_session(self, user_id: int) -> None:
+        """Remove session for a given user
+        """
+        try:
+            await self._db.update_user(user_id, session_id=None)
+        except NoResultFound:
+            pass
+
+    async def get_reset_password_token(self, email: str) -> str:
+        """Get reset_password token for a user with an email
+        """
+        try:
+            user = await self._db.find_user_by(email=email)
+            token = str(uuid.uuid4())
+            await self._db.update_user(user.id, reset_token=token)
+            return token
+        except NoResultFound:
+            raise ValueError
+
+    async def update_password(self, reset_token: str, password: str) -> None:
+        """Reset password of a user
+        """
+        try:
+            user = await self._db.find_user_by(reset_token=reset_token)
+            await self._db.update_user(
+                user.id, hashed_password=await self._hash(password),
+                reset_token=None)
+        except NoResultFound:
+            raise ValueError
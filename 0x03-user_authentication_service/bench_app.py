@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+"""Local load benchmark of the sync and async apps
+
+Start app.py (threaded Flask server) and async_app.py (uvicorn) on local
+ports with a fresh SQLite database each, drive their endpoints from
+concurrent client threads and report throughput and p50/p99 latency for
+every concurrency:
+
+    ./bench_app.py --concurrency 1 16 64 256 --requests 400
+    ./bench_app.py --apps async --endpoints "GET /profile"
+"""
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+
+PASSWORD = "bench pwd"
+SERVERS = {
+    "sync": "from app import app; "
+            "app.run(host='127.0.0.1', port={port}, threaded=True)",
+    "async": "import uvicorn; "
+             "uvicorn.run('async_app:app', host='127.0.0.1', port={port}, "
+             "log_level='warning', backlog=4096)",
+}
+
+
+def free_port() -> int:
+    """Pick a free local TCP port
+    """
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_app(kind: str, directory: str):
+    """Start the kind app with its database in directory
+    """
+    here = os.path.dirname(os.path.abspath(__file__))
+    port = free_port()
+    # Queue logins instead of shedding them, unless asked otherwise
+    env = dict({"HASH_QUEUE_SIZE": "4096"}, **os.environ)
+    env["DB_URL"] = "sqlite:///{}".format(os.path.join(directory, "bench.db"))
+    proc = subprocess.Popen(
+        [sys.executable, "-c", SERVERS[kind].format(port=port)], cwd=here,
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    base_url = "http://127.0.0.1:{}".format(port)
+    for _ in range(200):
+        try:
+            urllib.request.urlopen(base_url + "/", timeout=1)
+            return proc, base_url
+        except (urllib.error.URLError, ConnectionError):
+            if proc.poll() is not None:
+                break
+            time.sleep(0.05)
+    proc.kill()
+    raise RuntimeError("{} app did not start".format(kind))
+
+
+def call(method: str, url: str, headers: dict = None, data: dict = None):
+    """Send one request, return its status and response
+    """
+    body = urllib.parse.urlencode(data).encode() if data else None
+    req = urllib.request.Request(url, body, headers or {}, method=method)
+    try:
+        with urllib.request.urlopen(req, timeout=60) as resp:
+            resp.read()
+            return resp.status, resp
+    except urllib.error.HTTPError as e:
+        return e.code, e
+
+
+def login(base_url: str, email: str) -> dict:
+    """Register and log a user in, return the session cookie header
+    """
+    call("POST", base_url + "/users",
+         data={"email": email, "password": PASSWORD})
+    status, resp = call("POST", base_url + "/sessions",
+                        data={"email": email, "password": PASSWORD})
+    if status != 200:
+        return None
+    return {"Cookie": resp.headers.get("Set-Cookie", "").split(";")[0]}
+
+
+def scenarios(base_url: str) -> dict:
+    """Name -> function(worker, i, headers) of each timed operation
+    """
+    def profile(worker, i, headers):
+        return call("GET", base_url + "/profile", headers)[0]
+
+    def sessions(worker, i, headers):
+        return call("POST", base_url + "/sessions", data={
+            "email": "user{}@bench.io".format(worker),
+            "password": PASSWORD})[0]
+
+    def users(worker, i, headers):
+        return call("POST", base_url + "/users", data={
+            "email": "new{}-{}-{}@bench.io".format(worker, i, time.time()),
+            "password": PASSWORD})[0]
+    return {"GET /profile": profile, "POST /sessions": sessions,
+            "POST /users": users}
+
+
+def drive(run, base_url: str, concurrency: int, requests: int) -> dict:
+    """Run requests calls of run on concurrency threads, time them
+    """
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+    barrier = threading.Barrier(concurrency + 1)
+
+    def worker(worker_id: int):
+        headers = login(base_url, "user{}@bench.io".format(worker_id))
+        barrier.wait()
+        mine = []
+        failed = 0
+        for i in range(requests // concurrency):
+            start = time.perf_counter()
+            if run(worker_id, i, headers) >= 400:
+                failed += 1
+            mine.append(time.perf_counter() - start)
+        with lock:
+            latencies.extend(mine)
+            errors[0] += failed
+
+    threads = [threading.Thread(target=worker, args=(i,))
+               for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    barrier.wait()
+    start = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+
+    def pct(p):
+        if not latencies:
+            return 0.0
+        rank = min(len(latencies) - 1, int(p / 100 * len(latencies)))
+        return latencies[rank] * 1000
+
+    return {"requests": len(latencies), "errors": errors[0],
+            "req_per_sec": len(latencies) / elapsed if elapsed else 0.0,
+            "p50_ms": pct(50), "p99_ms": pct(99)}
+
+
+def main():
+    """Parse arguments and run the benchmark matrix
+    """
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--apps", nargs="+", default=["sync", "async"],
+                        choices=list(SERVERS))
+    parser.add_argument("--endpoints", nargs="+",
+                        default=["GET /profile", "POST /sessions"])
+    parser.add_argument("--concurrency", type=int, nargs="+",
+                        default=[1, 16, 64])
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("-o", "--output", help="write JSON results here")
+    args = parser.parse_args()
+
+    results = []
+    for kind in args.apps:
+        with tempfile.TemporaryDirectory() as directory:
+            proc, base_url = start_app(kind, directory)
+            try:
+                runs = scenarios(base_url)
+                for name in args.endpoints:
+                    for concurrency in args.concurrency:
+                        res = drive(runs[name], base_url, concurrency,
+                                    args.requests)
+                        res.update(app=kind, concurrency=concurrency,
+                                   endpoint=name)
+                        results.append(res)
+                        print("{app:<6} c={concurrency:<4} {endpoint:<16} "
+                              "{req_per_sec:>8.1f} req/s  "
+                              "p50={p50_ms:.1f}ms p99={p99_ms:.1f}ms "
+                              "errors={errors}".format(**res))
+            finally:
+                proc.terminate()
+                proc.wait()
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
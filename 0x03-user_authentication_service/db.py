@@ -1,35 +1,168 @@
 #!/usr/bin/env python3
 """DB module
 """
-from sqlalchemy import create_engine
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from sqlalchemy import (
+    Column, Integer, MetaData, Table, create_engine, event)
+from sqlalchemy.engine import Connection, Engine
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import scoped_session, sessionmaker
 from sqlalchemy.orm.session import Session
 from sqlalchemy.orm.exc import NoResultFound
-from sqlalchemy.exc import InvalidRequestError
+from sqlalchemy.exc import IntegrityError, InvalidRequestError
+from sqlalchemy.pool import QueuePool
+from typing import Iterator
 from user import Base, User
+import asyncio
+import functools
+import os
+
+
+DB_URL = "sqlite:///a.db"
+schema_metadata = MetaData()
+schema_version = Table(
+    "schema_version", schema_metadata,
+    Column("version", Integer, nullable=False))
+
+
+def _create_users_table(conn: Connection) -> None:
+    """Migration 1: create the users table
+    """
+    User.__table__.create(bind=conn, checkfirst=True)
+
+
+def _create_indexes(conn: Connection) -> None:
+    """Migration 2: build the missing indexes of the users table
+
+    create_all only creates indexes along with new tables, so this adds
+    them to a users table of an existing database, keeping its rows.
+    Creating the unique email index fails if emails are duplicated.
+    """
+    for index in User.__table__.indexes:
+        index.create(bind=conn, checkfirst=True)
+
+
+MIGRATIONS = [_create_users_table, _create_indexes]
+
+
+def _create_engine(url: str) -> Engine:
+    """Create an engine whose connections can be used from any thread
+
+    The pool holds DB_POOL_SIZE connections plus as many overflow ones,
+    or the single connection of an in-memory SQLite database. SQLite
+    connections are shared by the pool across threads, wait up to
+    DB_BUSY_TIMEOUT seconds for locks and use WAL journaling so readers
+    do not block the writer.
+    """
+    busy_timeout = float(os.getenv("DB_BUSY_TIMEOUT", "5"))
+    pool_size = int(os.getenv("DB_POOL_SIZE", "10"))
+    if not url.startswith("sqlite"):
+        return create_engine(url, echo=False, pool_size=pool_size,
+                             max_overflow=pool_size, pool_pre_ping=True)
+    memory = ":memory:" in url or url.rstrip("/") == "sqlite:"
+    # An in-memory database lives in its connection: every thread takes
+    # turns using a single one
+    pool_args = {"poolclass": QueuePool, "pool_size": 1, "max_overflow": 0}
+    if not memory:
+        pool_args.update(pool_size=pool_size, max_overflow=pool_size)
+    engine = create_engine(url, echo=False, connect_args={
+        "check_same_thread": False, "timeout": busy_timeout}, **pool_args)
+
+    @event.listens_for(engine, "connect")
+    def _set_sqlite_pragmas(dbapi_conn, connection_record):
+        """Configure every new SQLite connection
+        """
+        cursor = dbapi_conn.cursor()
+        if not memory:
+            cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA busy_timeout={}".format(
+            int(busy_timeout * 1000)))
+        cursor.close()
+    return engine
 
 
 class DB:
     """DB class
     """
 
-    def __init__(self) -> None:
+    def __init__(self, url: str = None, persistent: bool = None) -> None:
         """Initialize a new DB instance
+
+        Args:
+            url (str): database URL, DB_URL env var or sqlite:///a.db
+            persistent (bool): keep existing data, DB_PERSISTENT env var
+                by default. Otherwise the schema is dropped and rebuilt.
         """
-        self._engine = create_engine("sqlite:///a.db", echo=False)
-        Base.metadata.drop_all(self._engine)
-        Base.metadata.create_all(self._engine)
-        self.__session = None
+        if url is None:
+            url = os.getenv("DB_URL", DB_URL)
+        if persistent is None:
+            persistent = os.getenv("DB_PERSISTENT", "").lower() in (
+                "1", "true", "yes")
+        self._engine = _create_engine(url)
+        self.migrate(reset=not persistent)
+        # Loaded users stay usable once find_user_by ends its transaction
+        self._sessions = scoped_session(sessionmaker(
+            bind=self._engine, expire_on_commit=False))
+
+    @contextmanager
+    def _migration_transaction(self) -> Iterator[Connection]:
+        """Transaction holding the write lock of the database
+
+        pysqlite runs DDL outside of transactions, so on SQLite an
+        explicit BEGIN IMMEDIATE makes concurrent cold starts wait for
+        each other instead of racing to create the same tables.
+        """
+        if self._engine.dialect.name != "sqlite":
+            with self._engine.begin() as conn:
+                yield conn
+            return
+        with self._engine.connect().execution_options(
+                isolation_level="AUTOCOMMIT") as conn:
+            conn.exec_driver_sql("BEGIN IMMEDIATE")
+            try:
+                yield conn
+            except BaseException:
+                conn.exec_driver_sql("ROLLBACK")
+                raise
+            conn.exec_driver_sql("COMMIT")
+
+    def migrate(self, reset: bool = False) -> int:
+        """Apply the pending MIGRATIONS, return the schema version
+
+        The applied version is kept in the schema_version table, so a
+        warm start only reads it. Concurrent calls apply each migration
+        once. With reset, the schema is dropped first in the same
+        transaction, so a concurrent start never sees it half rebuilt.
+        """
+        with self._migration_transaction() as conn:
+            if reset:
+                Base.metadata.drop_all(bind=conn)
+                schema_metadata.drop_all(bind=conn)
+            schema_metadata.create_all(bind=conn)
+            row = conn.execute(schema_version.select()).fetchone()
+            version = row[0] if row else 0
+            for migration in MIGRATIONS[version:]:
+                migration(conn)
+            if row is None:
+                conn.execute(schema_version.insert().values(
+                    version=len(MIGRATIONS)))
+            elif version < len(MIGRATIONS):
+                conn.execute(schema_version.update().values(
+                    version=len(MIGRATIONS)))
+        return len(MIGRATIONS)
 
     @property
     def _session(self) -> Session:
-        """Memoized session object
+        """Session object of the current thread
+        """
+        return self._sessions()
+
+    def remove_session(self) -> None:
+        """Close the session of the current thread, e.g. at the end of
+        a request
         """
-        if self.__session is None:
-            DBSession = sessionmaker(bind=self._engine)
-            self.__session = DBSession()
-        return self.__session
+        self._sessions.remove()
 
     def add_user(self, email: str, hashed_password: str) -> User:
         """Add a new user to the database
@@ -40,10 +173,18 @@ class DB:
 
         Returns:
             User: Newly added User object
+
+        Raises:
+            IntegrityError: If the email is already registered
         """
         new_user = User(email=email, hashed_password=hashed_password)
         self._session.add(new_user)
-        self._session.commit()
+        try:
+            self._session.commit()
+        except IntegrityError:
+            # Leave the session usable for the next call of this thread
+            self._session.rollback()
+            raise
         return new_user
 
     def find_user_by(self, **kwargs) -> User:
@@ -63,6 +204,8 @@ class DB:
         if invalid_args:
             raise InvalidRequestError
         user = self._session.query(User).filter_by(**kwargs).first()
+        # End the read transaction to give the connection back to the pool
+        self._session.commit()
         if not user:
             raise NoResultFound
         return user
@@ -90,3 +233,61 @@ class DB:
 
         # Commit changes to the database
         self._session.commit()
+
+
+class AsyncDB:
+    """Asyncio interface of a DB
+
+    Every call runs on a pool of DB_WORKERS threads and closes the
+    session of its thread once done, so returned users are detached
+    with all their columns loaded.
+    """
+
+    def __init__(self, db: DB = None, workers: int = None) -> None:
+        """Initialize a new AsyncDB instance
+
+        Args:
+            db (DB): wrapped database, a new DB by default
+            workers (int): DB_WORKERS env var, 8 by default
+        """
+        if workers is None:
+            workers = int(os.getenv("DB_WORKERS", "8"))
+        self._db = DB() if db is None else db
+        self._executor = ThreadPoolExecutor(max_workers=workers)
+
+    def _call(self, method, *args, **kwargs):
+        """Run a DB method in a worker thread
+        """
+        try:
+            return method(*args, **kwargs)
+        finally:
+            self._db.remove_session()
+
+    def _add_user(self, email: str, hashed_password: str) -> User:
+        """Add a user, loading the columns the INSERT did not set
+        """
+        user = self._db.add_user(email, hashed_password)
+        self._db._session.refresh(user)
+        return user
+
+    async def _run(self, method, *args, **kwargs):
+        """Await a DB method run on the worker threads
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, functools.partial(
+            self._call, method, *args, **kwargs))
+
+    async def add_user(self, email: str, hashed_password: str) -> User:
+        """Add a new user to the database, see DB.add_user
+        """
+        return await self._run(self._add_user, email, hashed_password)
+
+    async def find_user_by(self, **kwargs) -> User:
+        """Find a user in the database, see DB.find_user_by
+        """
+        return await self._run(self._db.find_user_by, **kwargs)
+
+    async def update_user(self, user_id: int, **kwargs) -> None:
+        """Update user attributes in the database, see DB.update_user
+        """
+        return await self._run(self._db.update_user, user_id, **kwargs)
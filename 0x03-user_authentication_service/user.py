@@ -2,17 +2,29 @@
 """A module that will create a SQLAlchemy model named User for a database
 """
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy import Column, Integer, String
+from sqlalchemy import Column, Index, Integer, String
 
 Base = declarative_base()
 
 
 class User(Base):
     """A class that defines a user's model
+
+    email is unique and indexed. session_id and reset_token have unique
+    partial indexes that only cover non-null values.
     """
     __tablename__ = 'users'
     id = Column(Integer, primary_key=True)
-    email = Column(String(250), nullable=False)
+    email = Column(String(250), nullable=False, unique=True, index=True)
     hashed_password = Column(String(250), nullable=False)
     session_id = Column(String(250))
     reset_token = Column(String(250))
+
+    __table_args__ = (
+        Index('ix_users_session_id', session_id, unique=True,
+              sqlite_where=session_id.isnot(None),
+              postgresql_where=session_id.isnot(None)),
+        Index('ix_users_reset_token', reset_token, unique=True,
+              sqlite_where=reset_token.isnot(None),
+              postgresql_where=reset_token.isnot(None)),
+    )